@@ -4,21 +4,267 @@
 # File: clf.py
 # Language Version: Python 3.5.1
 # Depends On:   Pygame 1.9.2,
+#               clfcore.py,
 #               treasures.txt, 
 #               LiberationMono-Bold.ttf
 
-import os, sys, pygame
-from random import choice, randint
+import os, sys, io, csv, json, mmap, time, heapq, struct, hashlib, argparse, random, pygame
+from array import array
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from random import choice
 from pygame.locals import *
+from clfcore import (TreasureCorpus, TickScheduler, InputRecorder, readInputLog, getMoveDestination, getModeAfterKey,
+                     placeItems, PathSearch, NearestSearch, getASCIIScreens, GameSnapshot, writeSaveFile, readSaveFile,
+                     wanderStep, wanderModes, computeFieldOfView, minTreasures, treasureSymbols, treasureColorLevels)
+
+class GlyphCache():
+    """Keeps rendered text surfaces around so the same text in the same font and colors only
+    gets rendered once. Least recently used surfaces are thrown out when the cache gets
+    bigger than maxBytes. hits and misses count how often a render was saved or not."""
+    def __init__(self, maxBytes):
+        self.maxBytes = maxBytes
+        self.usedBytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.surfaces = OrderedDict()
+
+
+    # Returns the rendered surface, only calling font.render if it isn't already cached.
+    # The surfaces are shared, so don't draw on them, only blit them somewhere else.
+    def render(self, font, text, color, bgColor):
+        key = (font, text, color, bgColor)
+        surface = self.surfaces.get(key)
+        if surface is not None:
+            self.hits += 1
+            self.surfaces.move_to_end(key)
+            return surface
+        self.misses += 1
+        surface = font.render(text, True, color, bgColor)
+        self.surfaces[key] = surface
+        self.usedBytes += self.surfaceBytes(surface)
+        # Throw out the oldest surfaces until it fits, but always keep the one just rendered.
+        while self.usedBytes > self.maxBytes and len(self.surfaces) > 1:
+            oldKey, oldSurface = self.surfaces.popitem(last=False)
+            self.usedBytes -= self.surfaceBytes(oldSurface)
+        return surface
+
+
+    # Roughly how much memory a surface's pixels take up.
+    def surfaceBytes(self, surface):
+        return surface.get_width() * surface.get_height() * surface.get_bytesize()
+
+
+    # Returns the counters as a dictionary, handy for printing.
+    def getStats(self):
+        return {'hits': self.hits, 'misses': self.misses, 'entries': len(self.surfaces),
+                'usedBytes': self.usedBytes, 'maxBytes': self.maxBytes}
+
+
+
+class AssetBundle():
+    """One file holding the things that are slow to set up every time the game starts: the text screens
+    already rendered to raw pixels, the index of the entries in treasures.txt, and which font was used.
+    Loading memory maps the file, so the screens and the index are used straight out of it without copying.
+    Each bundle is stamped with a signature of the files it was made from, and is ignored if it doesn't match."""
+    magic = b'CLFBNDL\0'
+    version = 1
+    header = struct.Struct('<8sI32sI')
+    # Each section has a name, where it starts in the file, how long it is, and a width and height for pictures.
+    record = struct.Struct('<16sQQII')
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.bundleFile = None
+        self.bundleMap = None
+        # Maps section names to (data, width, height).
+        self.sections = {}
+
+
+    # Opens the bundle file, if it was made from the same source files. Returns False if it wasn't.
+    def load(self, signature):
+        try:
+            self.bundleFile = open(self.filename, 'rb')
+            self.bundleMap = mmap.mmap(self.bundleFile.fileno(), 0, access=mmap.ACCESS_READ)
+            magic, version, fileSignature, count = self.header.unpack_from(self.bundleMap, 0)
+            if magic != self.magic or version != self.version or fileSignature != signature:
+                self.close()
+                return False
+            view = memoryview(self.bundleMap)
+            for i in range(count):
+                name, start, length, width, height = self.record.unpack_from(self.bundleMap, self.header.size + i * self.record.size)
+                self.sections[name.rstrip(b'\0').decode('ascii')] = (view[start:start + length], width, height)
+        except (OSError, ValueError, struct.error):
+            self.close()
+            return False
+        return True
+
+
+    def addSurface(self, name, surface):
+        self.sections[name] = (pygame.image.tostring(surface, 'RGB'), surface.get_width(), surface.get_height())
+
+
+    def addBytes(self, name, data):
+        self.sections[name] = (bytes(data), 0, 0)
+
+
+    # The surface uses the bundle's memory directly, so don't draw on it.
+    def getSurface(self, name):
+        data, width, height = self.sections[name]
+        return pygame.image.frombuffer(data, (width, height), 'RGB')
+
+
+    def getBytes(self, name):
+        return self.sections[name][0]
+
+
+    # Writes the bundle to a temporary file first and then swaps it in, so a half written bundle is never used.
+    # If it can't be written that's fine, everything just gets set up the slow way again next time.
+    def save(self, signature):
+        tempFilename = self.filename + '.tmp'
+        names = sorted(self.sections)
+        position = self.header.size + len(names) * self.record.size
+        records = []
+        for name in names:
+            data, width, height = self.sections[name]
+            # Start each section on an 8 byte boundary, so the treasure index can be read in place.
+            position += -position % 8
+            records.append(self.record.pack(name.encode('ascii'), position, len(data), width, height))
+            position += len(data)
+        try:
+            with open(tempFilename, 'wb') as bundleFile:
+                bundleFile.write(self.header.pack(self.magic, self.version, signature, len(names)))
+                bundleFile.write(b''.join(records))
+                for name in names:
+                    bundleFile.write(b'\0' * (-bundleFile.tell() % 8))
+                    bundleFile.write(self.sections[name][0])
+            os.replace(tempFilename, self.filename)
+        except OSError:
+            pass
+
+
+    def close(self):
+        self.sections = {}
+        if self.bundleMap is not None:
+            try:
+                self.bundleMap.close()
+            except BufferError:
+                # Surfaces are still using it. It gets closed when they are gone.
+                pass
+            self.bundleMap = None
+        if self.bundleFile is not None:
+            self.bundleFile.close()
+            self.bundleFile = None
+
+
+
+class FrameProfiler():
+    """Times each part of every frame of the game loop: handling input, the game logic, drawing,
+    pushing the picture to the display, and sleeping until the next frame. It keeps the last windowSize
+    frames to work out the 50th, 95th and 99th percentile times, can show them over the game (press F3),
+    and can write every frame's times to a CSV file. The game only makes one of these if asked to,
+    so normally none of this costs anything."""
+    phases = ('input', 'update', 'draw', 'display', 'sleep')
+
+    def __init__(self, windowSize=300, csvFilename=None):
+        self.windowSize = windowSize
+        self.samples = dict((phase, deque(maxlen=windowSize)) for phase in self.phases + ('total',))
+        self.frameTimes = dict.fromkeys(self.phases, 0.0)
+        self.frameNumber = 0
+        self.frameMode = None
+        self.frameStart = 0.0
+        self.lastMark = 0.0
+        self.showHud = False
+        self.hudSurface = None
+        self.hudRefreshTime = 0.0
+        # How often the numbers on the HUD get worked out again, in seconds.
+        self.hudRefreshInterval = 0.5
+        self.csvFile = None
+        self.csvWriter = None
+        if csvFilename is not None:
+            self.csvFile = open(csvFilename, 'w', newline='')
+            self.csvWriter = csv.writer(self.csvFile)
+            self.csvWriter.writerow(('frame', 'mode') + tuple(phase + '_ms' for phase in self.phases + ('total',)))
+
+
+    def startFrame(self, mode):
+        self.frameMode = mode
+        self.frameStart = self.lastMark = time.perf_counter()
+
+
+    # Adds the time since the last mark to the phase that just finished.
+    def mark(self, phase):
+        now = time.perf_counter()
+        self.frameTimes[phase] += now - self.lastMark
+        self.lastMark = now
+
+
+    def endFrame(self):
+        total = self.lastMark - self.frameStart
+        for phase in self.phases:
+            self.samples[phase].append(self.frameTimes[phase])
+        self.samples['total'].append(total)
+        if self.csvWriter is not None:
+            self.csvWriter.writerow([self.frameNumber, self.frameMode] +
+                                    ['%.3f' % (self.frameTimes[phase] * 1000) for phase in self.phases] +
+                                    ['%.3f' % (total * 1000)])
+        self.frameTimes = dict.fromkeys(self.phases, 0.0)
+        self.frameNumber += 1
+
+
+    # Returns the 50th, 95th and 99th percentile times of a phase over the recent frames, in seconds.
+    def getPercentiles(self, phase):
+        times = sorted(self.samples[phase])
+        if len(times) == 0:
+            return 0.0, 0.0, 0.0
+        return tuple(times[min(len(times) - 1, int(len(times) * fraction))] for fraction in (0.5, 0.95, 0.99))
+
+
+    def toggleHud(self, settings_obj):
+        self.showHud = not self.showHud
+        self.hudSurface = None
+        # Whatever was under the HUD needs drawing again.
+        settings_obj.fullRedraw = True
+
+
+    # Blits the HUD in the top left corner, if it is switched on.
+    # The text is only rendered again every hudRefreshInterval seconds.
+    def drawHud(self, settings_obj):
+        if not self.showHud:
+            return
+        now = time.perf_counter()
+        if self.hudSurface is None or now - self.hudRefreshTime >= self.hudRefreshInterval:
+            lines = ['%-7s %6s %6s %6s' % ('ms', 'p50', 'p95', 'p99')]
+            for phase in self.phases + ('total',):
+                lines.append('%-7s %6.2f %6.2f %6.2f' % ((phase,) + tuple(t * 1000 for t in self.getPercentiles(phase))))
+            lineSurfaces = [settings_obj.littleFont.render(line, True, (255, 255, 255), (0, 0, 0)) for line in lines]
+            self.hudSurface = pygame.Surface((max(surf.get_width() for surf in lineSurfaces),
+                                              sum(surf.get_height() for surf in lineSurfaces)))
+            y_coord = 0
+            for surf in lineSurfaces:
+                self.hudSurface.blit(surf, (0, y_coord))
+                y_coord += surf.get_height()
+            self.hudRefreshTime = now
+        settings_obj.screenSurface.blit(self.hudSurface, (0, 0))
+        settings_obj.addDirtyRect(self.hudSurface.get_rect())
+
+
+    def close(self):
+        if self.csvFile is not None:
+            self.csvFile.close()
+            self.csvFile = None
+            self.csvWriter = None
+
+
 
 class GameSettings():
     """More like GameInitialization, but I'm sticking with GameSettings.
     Initializes pygame, and contains various values that need to be made available
     to other parts of the program, including the screen surface object."""
-    def __init__(self, startMode):
+    def __init__(self, startMode, options=None):
         """Sets up a great deal of info the game needs, keeps it all in one place.
         The GameSettings object instance will get passed around A LOT by other
-        methods and functions."""
+        methods and functions. options are the command line options from main(), if there are any."""
 
         # Characteristics of the window the game is displayed in.
         self.winWidth = 640
@@ -26,6 +272,7 @@ class GameSettings():
         self.winCaption = "Cyborg Locates Feline Game"
 
         # Characteristics of the grid of tiles the game take place on.
+        # The grid can be bigger than the window, in which case the window scrolls to follow the player.
         self.gridWidth = 40
         self.gridHeight = 40
         self.cellWidth = 16
@@ -38,27 +285,145 @@ class GameSettings():
         # The window background color
         self.bgColor = (51, 51, 51)
 
+        # How much memory the rendered text cache is allowed to use, in bytes.
+        self.glyphCacheSize = 4 * 1024 * 1024
+        # How many rendered treasure descriptions are kept for when they're bumped into again.
+        self.treasureTextCacheSize = 32
+
         # Treasures are the items spread around the screen for cyborg to examine.
         # Each one will look like a randomly selected character from the treasure symbols string.
-        self.treasureSymbols = "`-=[]\;,./~_+{}|:<>?!#$%^&*()1234567890zxcvbnmasdfghjklqwertyuiopZXCVBNMASDFGHJKLQWERTYUIOP"
+        self.treasureSymbols = treasureSymbols
         self.numOfTreasures = 20
+        # Every color a treasure can be. Treasures keep the position of their color and symbol in
+        # treasureColors and treasureSymbols instead of their own copies.
+        color_opts = treasureColorLevels
+        self.treasureColors = [(red, green, blue) for red in color_opts for green in color_opts for blue in color_opts]
+        # The feline's text isn't in treasures.txt, so it gets a text number of its own.
+        self.felineText = ["It is the feline! You are reunited!"]
+        self.felineTextIndex = -1
+
+        # Everything random about a board comes from rng. Setting seed to a number makes
+        # the same boards come up, in the same order, every time. None picks a different seed each run.
+        self.seed = None
+
+        # How many cells the autopilot looks through for a nearby treasure before heading for
+        # the closest one as the crow flies.
+        self.exploreSearchSize = 20000
+        # The autopilot's path searches are spread over as many ticks as they need, looking through at most
+        # pathSearchBudget cells each tick, so a long search never holds up a frame. A click gives up after
+        # clickSearchScreens screens' worth of cells, since anywhere on screen is usually much closer than that.
+        self.pathSearchBudget = 2000
+        self.clickSearchScreens = 4
+
+        # F5 saves the game to saveFilename, and it's saved there every autosaveInterval seconds too (0 means never).
+        self.saveFilename = 'clf.save'
+        self.autosaveInterval = 60
+        self.saveRequested = False
+
+        # Treasures can wander around the board. wanderMode 'feline' makes just feline wander, 'sample' makes
+        # a random sample of all the treasures wander, and 'off' keeps them still. Each tick, each one that wanders
+        # has wanderChance of trying to take a step. In 'sample', no more than wanderLimit of them try on the
+        # same tick, so a huge board can't slow the game down; 0 means no limit, and then everything wanders.
+        self.wanderMode = 'off'
+        self.wanderChance = 0.25
+        self.wanderLimit = 2000
+
+        # With fogOfWar on, cyborg's sensors only reach sightRadius cells, and treasures block them. Cells that
+        # have been seen before stay on screen, dimmed, in exploredColor. Cells never seen are left black.
+        self.fogOfWar = False
+        self.sightRadius = 8
+        self.unexploredColor = (0, 0, 0)
+        self.exploredColor = (26, 26, 26)
+
+        # Command line options, if there are any, change the values above.
+        if options is not None:
+            if options.width is not None:
+                self.gridWidth = options.width
+            if options.height is not None:
+                self.gridHeight = options.height
+            if options.treasures is not None:
+                self.numOfTreasures = options.treasures
+            self.seed = options.seed
+            if options.save is not None:
+                self.saveFilename = options.save
+            if options.autosave is not None:
+                self.autosaveInterval = options.autosave
+            if options.wander is not None:
+                self.wanderMode = options.wander
+            if options.wander_chance is not None:
+                self.wanderChance = options.wander_chance
+            if options.wander_limit is not None:
+                self.wanderLimit = options.wander_limit
+            self.fogOfWar = options.fog
+            if options.sight is not None:
+                self.sightRadius = options.sight
+
+        # The seed is always picked here, rather than left to random, so a recording can note it down.
+        if self.seed is None:
+            self.seed = random.randrange(2 ** 63)
+        self.rng = random.Random(self.seed)
 
         # tresureList will contain the list of each tresure on the grid.
         self.treasureList = []
-        # locationList will contain the location of each treasure in a list of 2 item lists.
-        # Each item will be a 2 item list of the form [x, y]
-        # This does not describe the pixel position but the grid position.
-        # This list will be checked everytime an item is placed randomly on the screen so that
-        # no 2 items are placed in the same place.
-        self.locationList = []
+        # boardSnapshot has the current board packed up ready for saving, made by buildBoard(). examinedTreasures
+        # are the treasures that have been bumped into since. Wandering treasures are moved in it as they go.
+        self.boardSnapshot = None
+        self.examinedTreasures = []
+        # plannedRngState is the random number state from just before the next board started being planned, while
+        # the win screen is up. The planning uses rng on another thread, so that's the state to save until the
+        # new board is in, or a resumed game would get a different next board.
+        self.plannedRngState = None
+        # felineTreasure is the feline's Treasure, so it can be found without looking. movedCells are the
+        # cells treasures have wandered out of and into since the last frame, which need redrawing.
+        self.felineTreasure = None
+        self.movedCells = []
+        # visibleCells are the set of (x, y) cells the player can see right now. exploredCells has all the ones
+        # they've seen on this board, with the Treasure that was in each when it was last in sight, or None,
+        # so cells out of sight show what was there then rather than where wandering treasures are now.
+        # They're only used with fogOfWar on.
+        self.visibleCells = set()
+        self.exploredCells = {}
+        # locationMap finds the treasure at a grid location. The keys are (x, y) tuples
+        # and the values are Treasure instances. This is the grid position, not the pixel position.
+        # It is checked everytime an item is placed randomly on the screen so that
+        # no 2 items are placed in the same place, and everytime the player tries to move.
+        # It's filled in with treasureList by buildBoard() and useBoard(), or addTreasure() when a saved game
+        # is put back, and wanderTreasures() moves treasures around in it, so it always matches where they are.
+        self.locationMap = {}
 
         # gameMode is used so the program knows what to display and what
         # input to respond to while running different parts of the program.
         self.gameModes = ['splash', 'message', 'instructions', 'play', 'win', 'credits']
         # If the program just started this will set gameMode to 'splash'.
-        # If the user is starting a new game after winning, it will set gameMode to 'play'.
         self.gameMode = startMode
-
+        # Set by requestNewGame() when the player wants another go, so the GameSession
+        # can build a new board without setting everything else up again.
+        self.newGameRequested = False
+
+        # With dirty rectangles turned on, only the parts of the screen that changed since the last
+        # frame get redrawn and pushed to the display. fullRedraw forces the next frame to repaint
+        # everything, which is needed whenever the mode changes. dirtyRects holds the Rects to update,
+        # or None if the whole window needs updating.
+        self.useDirtyRects = True
+        self.fullRedraw = True
+        self.dirtyRects = None
+        # Where the player was drawn last frame, so that cell can be cleaned up when they move.
+        self.lastPlayerCell = None
+
+        # In every mode except play, nothing changes until a key is pressed, so instead of
+        # looping 15 times a second the game sleeps until something happens. idleTimeout is the
+        # longest it sleeps for, in milliseconds, before checking in anyway.
+        self.idleModes = ['splash', 'message', 'instructions', 'win', 'credits']
+        self.idleTimeout = 1000
+        self.waitingEvents = []
+
+
+        # The files the game is made from.
+        self.fontFilename = 'LiberationMono-Bold.ttf'
+        self.treasureFilename = 'treasures.txt'
+        # The asset bundle keeps the rendered screens and the treasure index from the last run,
+        # so they don't have to be made again unless one of the files above has changed.
+        self.bundleFilename = 'clf.bundle'
 
         # set up pygame and the pygame window
         pygame.init()
@@ -66,124 +431,279 @@ class GameSettings():
         pygame.display.set_caption(self.winCaption)
 
         # Now initialize things that couldn't be set up until after the pygame initialization.
-        # Set up the fonts.
-        try:
-            self.bigFont = pygame.font.Font('LiberationMono-Bold.ttf', self.bigFontSize)
-            self.littleFont = pygame.font.Font('LiberationMono-Bold.ttf', self.littleFontSize)
-        except:
-            self.bigFont = pygame.font.SysFont('monospace', self.bigFontSize, True, False)
-            self.littleFont = pygame.font.SysFont('monospace', self.littleFontSize, True, False)
-
-
         # Get the contents of the ASCII text screens the game uses.
         self.screens = getASCIIScreens()
 
-        # Render each screen's text as a surface that can be blitted to the screen.
-        self.splashSurface = self.createTextSprite(self.screens['splash'])
-        self.instructionsSurface = self.createTextSprite(self.screens['instructions'])
-        self.winSurface = self.createTextSprite(self.screens['win'])
-        self.creditsSurface = self.createTextSprite(self.screens['credits'])
+        self.assetBundle = AssetBundle(self.bundleFilename)
+        self.bundleLoaded = self.assetBundle.load(self.getAssetSignature())
+        if self.bundleLoaded:
+            fontInfo = json.loads(bytes(self.assetBundle.getBytes('fontInfo')).decode('utf-8'))
+            self.loadFonts(fontInfo['file'] is not None)
+        else:
+            self.loadFonts(True)
+
+        # Every bit of text the game renders goes through this cache,
+        # so symbols and lines that come up again don't get rendered again.
+        self.glyphCache = GlyphCache(self.glyphCacheSize)
 
+        # Render each screen's text as a surface that can be blitted to the screen,
+        # or take them from the bundle if they were rendered last time.
         # Read the treasure descriptions from an external file.
-        self.treasureTextList = self.readTreasureText('treasures.txt')
-
-        # A clock to check/control framerate.
+        # treasureTexts stays the same for every game, and treasureTextPicks holds the entry numbers
+        # picked for the current board that haven't been used yet.
+        if self.bundleLoaded:
+            self.splashSurface = self.assetBundle.getSurface('splash')
+            self.instructionsSurface = self.assetBundle.getSurface('instructions')
+            self.winSurface = self.assetBundle.getSurface('win')
+            self.creditsSurface = self.assetBundle.getSurface('credits')
+            self.treasureTexts = TreasureCorpus(self.treasureFilename, offsets=self.assetBundle.getBytes('treasureIndex').cast('Q'))
+        else:
+            self.splashSurface = self.createTextSprite(self.screens['splash'])
+            self.instructionsSurface = self.createTextSprite(self.screens['instructions'])
+            self.winSurface = self.createTextSprite(self.screens['win'])
+            self.creditsSurface = self.createTextSprite(self.screens['credits'])
+            self.treasureTexts = self.readTreasureText(self.treasureFilename)
+            self.saveAssetBundle()
+        self.treasureTextPicks = []
+        # The surfaces treasures share. See getTreasureTextSurface() and getSymbolSurface().
+        self.treasureTextSurfaces = OrderedDict()
+        self.symbolSurfaces = [None] * (len(self.treasureColors) * len(self.treasureSymbols))
+        self.dimSymbolSurfaces = [None] * (len(self.treasureColors) * len(self.treasureSymbols))
+        # The symbols are rendered taller than a cell, so only symbolArea of each one is blitted.
+        self.symbolArea = self.getSymbolArea()
+
+        # A clock to check/control framerate. frameRate is how often the screen is drawn, 0 means as often as possible.
+        # tickRate is how many times a second the game logic runs, which sets how fast cyborg moves.
+        # They are kept separate, so drawing faster doesn't make cyborg faster.
         self.clock = pygame.time.Clock()
+        self.frameRate = 60
+        self.tickRate = 15
+        self.tickScheduler = TickScheduler(self.tickRate)
+
+        # Times each part of the game loop, if switched on with --profile or --profile-csv.
+        self.profiler = None
+        if options is not None and (options.profile or options.profile_csv is not None):
+            self.profiler = FrameProfiler(csvFilename=options.profile_csv)
+            self.profiler.showHud = options.profile
+
+        # Writes down the player's input, so the session can be replayed, if switched on with --record.
+        self.recorder = None
+        if options is not None and options.record is not None:
+            self.recorder = InputRecorder(options.record, self.seed, self.gridWidth, self.gridHeight,
+                                          self.numOfTreasures, startMode, self.wanderMode, self.wanderChance,
+                                          self.wanderLimit)
+
+
+    # Set up the fonts. The font file is only read once, and both sizes are made from the same copy of it.
+    # If the bundle says the font file didn't work last time, tryFile is False and it isn't tried again.
+    def loadFonts(self, tryFile):
+        self.fontFileUsed = None
+        if tryFile:
+            try:
+                with open(self.fontFilename, 'rb') as fontFile:
+                    fontData = fontFile.read()
+                self.bigFont = pygame.font.Font(io.BytesIO(fontData), self.bigFontSize)
+                self.littleFont = pygame.font.Font(io.BytesIO(fontData), self.littleFontSize)
+                self.fontFileUsed = self.fontFilename
+                return
+            except:
+                pass
+        self.bigFont = pygame.font.SysFont('monospace', self.bigFontSize, True, False)
+        self.littleFont = pygame.font.SysFont('monospace', self.littleFontSize, True, False)
+
+
+    # A fingerprint of everything the asset bundle is made from. If any of it changes,
+    # so does the signature, and the bundle gets made again.
+    def getAssetSignature(self):
+        fingerprint = hashlib.sha256()
+        fingerprint.update(repr((AssetBundle.version, pygame.version.ver, sys.byteorder,
+                                 self.bigFontSize, self.littleFontSize, self.screens)).encode('utf-8'))
+        for filename in (self.fontFilename, self.treasureFilename):
+            try:
+                stats = os.stat(filename)
+                fingerprint.update(repr((filename, stats.st_size, stats.st_mtime_ns)).encode('utf-8'))
+            except OSError:
+                fingerprint.update(repr((filename, None)).encode('utf-8'))
+        return fingerprint.digest()
+
+
+    # Saves the rendered screens, the treasure index and the font details for next time.
+    def saveAssetBundle(self):
+        bundle = AssetBundle(self.bundleFilename)
+        bundle.addSurface('splash', self.splashSurface)
+        bundle.addSurface('instructions', self.instructionsSurface)
+        bundle.addSurface('win', self.winSurface)
+        bundle.addSurface('credits', self.creditsSurface)
+        bundle.addBytes('treasureIndex', self.treasureTexts.offsets.tobytes())
+        fontInfo = {'file': self.fontFileUsed, 'bigFontSize': self.bigFontSize, 'littleFontSize': self.littleFontSize,
+                    'bigLineSize': self.bigFont.get_linesize(), 'littleLineSize': self.littleFont.get_linesize()}
+        bundle.addBytes('fontInfo', json.dumps(fontInfo).encode('utf-8'))
+        bundle.save(self.getAssetSignature())
 
 
     # The game might quit from a few different places, so I wrote the code to close just once.
     def quitGame(self):
+        self.treasureTexts.close()
+        if self.profiler is not None:
+            self.profiler.close()
+        if self.recorder is not None:
+            self.recorder.close()
         pygame.quit()
         sys.exit()
 
 
+    # Anything that belongs to one board and not the whole session is set back to the start here.
+    # The fonts, screens and treasure texts are left alone, since they don't change between games.
+    def resetBoard(self):
+        self.treasureList = []
+        self.boardSnapshot = None
+        self.examinedTreasures = []
+        self.plannedRngState = None
+        self.felineTreasure = None
+        self.movedCells = []
+        self.visibleCells = set()
+        self.exploredCells = {}
+        self.locationMap = {}
+        self.treasureTextPicks = []
+        self.newGameRequested = False
+        self.fullRedraw = True
+        self.dirtyRects = None
+        self.lastPlayerCell = None
+
+
+    # Ask for a new board. The GameSession sees this after the input is processed.
+    def requestNewGame(self):
+        self.newGameRequested = True
+
+
     # This function makes sure when we change the mode,
     # it is an actual mode the program knows what to do with.
     def changeMode(self, newMode):
         if newMode in self.gameModes:
+            if newMode != self.gameMode:
+                self.fullRedraw = True
             self.gameMode = newMode
 
 
     # When the player bumps into something, this function will return which item is is.
+    # Returns None if nothing is there.
     def getTreasureItemAt(self, x, y):
-        for treasure in self.treasureList:
-            if treasure.x_coord == x and treasure.y_coord == y:
-                return treasure
+        return self.locationMap.get((x, y))
 
 
-    # Each treasure will have a different color selected at random.
-    def getRandomColor(self):
-        color_opts = (102, 153, 204, 255)
-        red = choice(color_opts)
-        green = choice(color_opts)
-        blue = choice(color_opts)
-        return tuple([red, green, blue])
+    # True if there is a treasure at the grid location.
+    def isOccupied(self, x, y):
+        return (x, y) in self.locationMap
+
+
+    # Put a treasure on the board.
+    def addTreasure(self, treasure):
+        self.treasureList.append(treasure)
+        self.locationMap[(treasure.x_coord, treasure.y_coord)] = treasure
+        if treasure.feline:
+            self.felineTreasure = treasure
 
 
-    # This will return a random grid location, for placing items on the board.
-    def getRandomCoordinates(self):
-        x_coord = choice(range(self.gridWidth))
-        y_coord = choice(range(self.gridHeight))
-        return x_coord, y_coord
+    # Each treasure will have a different color selected at random.
+    # Returns where the color is in treasureColors.
+    def getRandomColorIndex(self):
+        red = self.rng.randrange(4)
+        green = self.rng.randrange(4)
+        blue = self.rng.randrange(4)
+        return red * 16 + green * 4 + blue
 
 
     # Here we populate the treasureList with the items that cyborg will examine.
+    # The locations for all the treasures and the player's starting point are picked together, all different,
+    # so nothing has to be retried however crowded the board is. The player's start is kept in playerStart.
     def populateTreasureList(self, grid_obj):
-        kitten_placed = False
-        for i in range(self.numOfTreasures - 1):
-            # Get a random location to place the new treasure in.
-            x, y = self.getRandomCoordinates()
-            # This loop makes sure the same location hasn't already been used.
-            while [x, y] in self.locationList:
-                x, y = self.getRandomCoordinates()
-            # Place the new location in the locationList
-            self.locationList.append([x, y])
-            # place the whole treasure in the treasureList.
-            if kitten_placed:
-                treasure = Treasure(self, grid_obj, x, y, False, self.getRandomTreasureText())
+        items, playerStart = self.planBoard()
+        # place the whole board in the treasureList and locationMap.
+        self.useBoard(self.buildBoard(items, playerStart, grid_obj))
+
+
+    # Works out everything about a new board that doesn't need pygame: where everything goes, and each
+    # treasure's text, color and symbol. Returns a list of (x, y, feline, textIndex, colorIndex, symbolIndex)
+    # tuples, one for each treasure, and where the player starts. It only uses rng and treasureTexts,
+    # so it can run on another thread while the win screen is showing.
+    def planBoard(self):
+        if self.numOfTreasures < minTreasures:
+            raise ValueError("A board needs at least {} treasures, counting feline.".format(minTreasures))
+        locations = placeItems(self.gridWidth, self.gridHeight, self.numOfTreasures, self.rng)
+        playerStart = locations.pop()
+        self.treasureTextPicks = []
+        items = []
+        for x, y in locations:
+            if len(items) > 0:
+                feline = False
+                textIndex = self.getRandomTreasureTextIndex()
             else:
                 # The first item to place will be the feline.
-                treasure = Treasure(self, grid_obj, x, y, True)
-                treasure.text = "It is the feline! You are reunited!"
-                kitten_placed = True
-            self.treasureList.append(treasure)
-
-
-    # This function reads each entry in the treasures.txt file.
-    # Each entry is added to a list. Each element of the list is a
-    # list of the lines in the entry. Some will have only one line,
+                feline = True
+                textIndex = self.felineTextIndex
+            colorIndex = self.getRandomColorIndex()
+            symbolIndex = self.rng.randrange(len(self.treasureSymbols))
+            items.append((x, y, feline, textIndex, colorIndex, symbolIndex))
+        return items, playerStart
+
+
+    # Returns the save file's contents for the game as it is right now, as a list of byte strings for writeSaveFile().
+    # Only the header and a byte per treasure are packed here, and the treasures' locations are copied straight
+    # out of the snapshot's arrays, so it's quick enough to do in the middle of a frame.
+    def packSaveData(self, player_obj):
+        snapshot = self.boardSnapshot
+        snapshot.seed = self.seed
+        snapshot.gridWidth = self.gridWidth
+        snapshot.gridHeight = self.gridHeight
+        snapshot.numOfTreasures = self.numOfTreasures
+        snapshot.playerX = player_obj.x_coord
+        snapshot.playerY = player_obj.y_coord
+        snapshot.mode = self.gameMode
+        snapshot.collidingWith = -1 if player_obj.collidingWith is None else player_obj.collidingWith.number
+        snapshot.textCount = len(self.treasureTexts)
+        rngState = self.rng.getstate() if self.plannedRngState is None else self.plannedRngState
+        snapshot.rngState = array('I', rngState[1])
+        flags = bytearray(snapshot.flags)
+        for treasure in self.examinedTreasures:
+            flags[treasure.number] |= GameSnapshot.EXAMINED
+        return snapshot.pack(flags)
+
+
+    # Turns the list from planBoard() into Treasures. Nothing is rendered here, since the surfaces
+    # are only made the first time they're drawn.
+    def makeTreasures(self, items, grid_obj):
+        return [Treasure(self, grid_obj, x, y, feline, textIndex, colorIndex, symbolIndex)
+                for x, y, feline, textIndex, colorIndex, symbolIndex in items]
+
+
+    # Makes everything a board from planBoard() needs to be played, without touching the board being played now:
+    # the treasures, the treasureList and locationMap that hold them, felineTreasure, and the boardSnapshot for
+    # saving. Each treasure's number is its place in the snapshot, so the ones that get examined or move later
+    # can be found in it. Returns them with the player's start as a tuple for useBoard(),
+    # so the board can be built while another one is showing.
+    def buildBoard(self, items, playerStart, grid_obj):
+        treasureList = self.makeTreasures(items, grid_obj)
+        locationMap = dict(zip([(item[0], item[1]) for item in items], treasureList))
+        snapshot = GameSnapshot()
+        snapshot.setTreasures(items)
+        for number, treasure in enumerate(treasureList):
+            treasure.number = number
+        # planBoard() always puts feline first.
+        return treasureList, locationMap, treasureList[0], snapshot, playerStart
+
+
+    # Swaps in a board from buildBoard(). It only sets a few references, however big the board is.
+    def useBoard(self, board):
+        self.treasureList, self.locationMap, self.felineTreasure, self.boardSnapshot, self.playerStart = board
+
+
+    # This function opens the treasures.txt file as a TreasureCorpus.
+    # Each entry is a list of the lines in it. Some will have only one line,
     # some will have more. Each line has to be stored separately,
     # because each line must be rendered and blitted seperately.
+    # The entries are only read from the file when they are picked, so a huge file loads as fast as a small one.
     def readTreasureText(self, filename):
-        try:
-            # This is the list of all the lists.
-            treasureDescripts = []
-            textfile = open(filename,'r')
-            lines = textfile.readlines()
-            # This varibale will hold the list of lines
-            # for a single entry from the treasures.txt file.
-            description = []
-            for line in range(len(lines)):
-                if lines[line][0] == '#':       # '#' is ignored as a comment.
-                    pass
-                elif lines[line][0] != '\n':
-                # if the line is not blank, it is appended to the current list.
-                    description.append(lines[line].strip())
-                elif lines[line][0] == '\n' and len(description) > 0:
-                # if the line is blank and the list has something in it,
-                # it is appended to the list of lists.
-                    treasureDescripts.append(description)
-                    description = []
-            # This if statment makes sure the last entry is not ignored,
-            # even if it is not followed by a blank line.
-            if len(description) > 0:
-                treasureDescripts.append(description)
-        except FileNotFoundError:
-            # In case the treasures.txt is not readable for some reason,
-            # this will create a list of boring texts for the game items.
-            treasureDescripts = [['This is not feline.']] * self.numOfTreasures
-
-        return treasureDescripts
+        return TreasureCorpus(filename)
 
 
     # This will read a file containing text to be printed exactly as is.
@@ -198,13 +718,89 @@ class GameSettings():
         return screenText
 
 
-    # This will return a random entry from the list returned by the readTreasureText() method.
-    # It will be called everytime a new Treasure instance is created.
-    def getRandomTreasureText(self):
-        index = randint(0, len(self.treasureTextList) - 1)
-        textToReturn = self.treasureTextList[index]
-        del self.treasureTextList[index]
-        return textToReturn
+    # This will return the number of a random entry in the TreasureCorpus returned by the readTreasureText() method.
+    # It will be called everytime a new Treasure instance is planned.
+    # Enough different entries for a whole board are picked at once, then handed out one at a time.
+    def getRandomTreasureTextIndex(self):
+        if len(self.treasureTextPicks) == 0:
+            self.treasureTextPicks = self.treasureTexts.sample(self.numOfTreasures, self.rng)
+        return self.treasureTextPicks.pop()
+
+
+    # Returns the lines of text for a text number from getRandomTreasureTextIndex(), or felineTextIndex.
+    def getTreasureText(self, textIndex):
+        if textIndex == self.felineTextIndex:
+            return self.felineText
+        return self.treasureTexts.getEntry(textIndex)
+
+
+    # A treasure's description is only rendered the first time it's shown, since most never get bumped into.
+    # Treasures with the same text share one surface, kept in treasureTextSurfaces by text number. Only the
+    # treasureTextCacheSize most recently shown are kept, and the one shown longest ago is thrown out first.
+    def getTreasureTextSurface(self, treasure_obj):
+        textSurfaces = self.treasureTextSurfaces
+        textSurface = textSurfaces.get(treasure_obj.textIndex)
+        if textSurface is not None:
+            textSurfaces.move_to_end(treasure_obj.textIndex)
+            return textSurface
+        # Leave a cell's width of room on each side.
+        maxWidth = self.winWidth - 2 * self.cellWidth
+        textSurface = self.createTextSprite(self.wrapText(self.getTreasureText(treasure_obj.textIndex), self.bigFont, maxWidth))
+        textSurfaces[treasure_obj.textIndex] = textSurface
+        while len(textSurfaces) > self.treasureTextCacheSize:
+            textSurfaces.popitem(last=False)
+        return textSurface
+
+
+    # Splits any line too wide to fit in maxWidth pixels at the spaces between words.
+    # A word that won't fit on a line by itself is split wherever it has to be.
+    def wrapText(self, lines, font, maxWidth):
+        wrapped = []
+        for line in lines:
+            if font.size(line)[0] <= maxWidth:
+                wrapped.append(line)
+                continue
+            current = ''
+            for word in line.split():
+                attempt = word if current == '' else current + ' ' + word
+                if font.size(attempt)[0] <= maxWidth:
+                    current = attempt
+                    continue
+                if current != '':
+                    wrapped.append(current)
+                while font.size(word)[0] > maxWidth and len(word) > 1:
+                    cut = len(word) - 1
+                    while cut > 1 and font.size(word[:cut])[0] > maxWidth:
+                        cut -= 1
+                    wrapped.append(word[:cut])
+                    word = word[cut:]
+                current = word
+            wrapped.append(current)
+        return wrapped
+
+
+    # Treasures with the same symbol and color share one surface too. symbolSurfaces has a place for
+    # every symbol in every color, filled in the first time it's needed.
+    def getSymbolSurface(self, treasure_obj):
+        index = treasure_obj.colorIndex * len(self.treasureSymbols) + treasure_obj.symbolIndex
+        symbolSurface = self.symbolSurfaces[index]
+        if symbolSurface is None:
+            symbolSurface = self.glyphCache.render(self.littleFont, self.treasureSymbols[treasure_obj.symbolIndex],
+                                                   self.treasureColors[treasure_obj.colorIndex], self.bgColor)
+            self.symbolSurfaces[index] = symbolSurface
+        return symbolSurface
+
+
+    # The same as getSymbolSurface(), but in half the brightness on exploredColor, for treasures in the fog.
+    def getDimSymbolSurface(self, treasure_obj):
+        index = treasure_obj.colorIndex * len(self.treasureSymbols) + treasure_obj.symbolIndex
+        symbolSurface = self.dimSymbolSurfaces[index]
+        if symbolSurface is None:
+            color = tuple(channel // 2 for channel in self.treasureColors[treasure_obj.colorIndex])
+            symbolSurface = self.glyphCache.render(self.littleFont, self.treasureSymbols[treasure_obj.symbolIndex],
+                                                   color, self.exploredColor)
+            self.dimSymbolSurfaces[index] = symbolSurface
+        return symbolSurface
 
 
     # This method takes a list of strings and renders them one at a time. Then it blits each one
@@ -214,7 +810,7 @@ class GameSettings():
         surfWidth = 0
         surfHeight = 0
         for line in strToDraw:
-            lineSurface = self.bigFont.render(line, True, (255, 255, 255), (0, 0, 0))
+            lineSurface = self.glyphCache.render(self.bigFont, line, (255, 255, 255), (0, 0, 0))
             lineSurfaceList.append(lineSurface)
             surfHeight += lineSurface.get_height()
             if lineSurface.get_width() > surfWidth:
@@ -230,9 +826,18 @@ class GameSettings():
         return fullSurface
 
 
+    # The part of a rendered symbol that fits in a cell. The font's line is taller than a cell, so blitting the
+    # whole surface would spill into the cell below, where redrawing just that cell wouldn't clean it up.
+    # The blank rows at the top are skipped, as far as needed to fit every symbol's ink in the cell.
+    def getSymbolArea(self):
+        inkRect = self.littleFont.render(self.treasureSymbols + '@', True, (255, 255, 255)).get_bounding_rect()
+        top = max(0, min(inkRect.top, inkRect.bottom - self.cellHeight))
+        return Rect(0, top, self.cellWidth, self.cellHeight)
+
+
     # Render the symbol of an object as a Surface that can be blitted to the screen.
     def createSymbolSprite(self, symbol_obj):
-        symbolSurface = self.littleFont.render(symbol_obj.symbol, True, symbol_obj.color, self.bgColor)
+        symbolSurface = self.glyphCache.render(self.littleFont, symbol_obj.symbol, symbol_obj.color, self.bgColor)
         return symbolSurface
 
 
@@ -243,48 +848,182 @@ class GameSettings():
         screenRect = self.screenSurface.get_rect()
         textRect.center = screenRect.center
         self.screenSurface.blit(textSurface, textRect)
+        self.addDirtyRect(textRect)
+
+
+    # Sleeps until there is an event to deal with, or idleTimeout runs out. The event is kept in
+    # waitingEvents for the mode's input function to find. If the screen still needs drawing it doesn't wait.
+    def waitForInput(self):
+        if self.fullRedraw or pygame.event.peek():
+            return
+        try:
+            event = pygame.event.wait(self.idleTimeout)
+        except TypeError:
+            # Pygame before 2.0 can't time out, so it just waits.
+            event = pygame.event.wait()
+        if event.type == NOEVENT:
+            return
+        if event.type == VIDEOEXPOSE:
+            # Another window was in the way, so everything needs drawing again.
+            self.fullRedraw = True
+        self.waitingEvents.append(event)
+
+
+    # Returns all the events that have happened since last time, including any waitForInput() picked up.
+    def getEvents(self):
+        events = self.waitingEvents + pygame.event.get()
+        self.waitingEvents = []
+        return events
+
+
+    # Remember that part of the screen changed, so it gets pushed to the display this frame.
+    def addDirtyRect(self, rect):
+        if self.dirtyRects is not None:
+            self.dirtyRects.append(rect)
+
+
+    # Call this after a full repaint, so the whole window gets pushed to the display.
+    def markAllDirty(self):
+        self.dirtyRects = None
+        self.fullRedraw = not self.useDirtyRects
+
+
+    # Push whatever changed this frame to the display, then start collecting changes for the next one.
+    def updateDisplay(self):
+        if self.dirtyRects is None:
+            pygame.display.update()
+        elif len(self.dirtyRects) > 0:
+            pygame.display.update(self.dirtyRects)
+        self.dirtyRects = []
+
+
+    # Clear a single grid cell and draw whatever is in it now.
+    # In the fog, cells out of sight are drawn dimmed, with whatever was in them when they were last seen,
+    # if they've been seen before, and left black if not.
+    def redrawCell(self, hero_obj, grid_obj, x, y):
+        cell = grid_obj.getCell(x, y)
+        if cell is None:
+            return
+        if self.fogOfWar and (x, y) not in self.visibleCells:
+            if (x, y) in self.exploredCells:
+                grid_obj.fillCell(self, x, y, self.exploredColor)
+                treasure = self.exploredCells[(x, y)]
+                if treasure is not None:
+                    grid_obj.blitSymbol(self, x, y, self.getDimSymbolSurface(treasure))
+            else:
+                grid_obj.fillCell(self, x, y, self.unexploredColor)
+            self.addDirtyRect(cell.box)
+            return
+        grid_obj.fillCell(self, x, y, self.bgColor)
+        if hero_obj.x_coord == x and hero_obj.y_coord == y:
+            grid_obj.blitSymbol(self, x, y, hero_obj.symbolSurface)
+        else:
+            treasure = self.getTreasureItemAt(x, y)
+            if treasure is not None:
+                grid_obj.blitSymbol(self, x, y, self.getSymbolSurface(treasure))
+        self.addDirtyRect(cell.box)
+
+
+    # Works out what the player can see from where they are now, with clfcore.computeFieldOfView(), which only
+    # looks at the cells within sightRadius, and remembers what's in each of them for when they're out of sight.
+    # Returns the cells that have come into sight or gone out of it, since they're the only ones that need redrawing.
+    def updateFieldOfView(self, hero_obj):
+        locationMap = self.locationMap
+        visible = computeFieldOfView(hero_obj.x_coord, hero_obj.y_coord, self.sightRadius,
+                                     self.gridWidth, self.gridHeight, locationMap)
+        changed = visible.symmetric_difference(self.visibleCells)
+        self.visibleCells = visible
+        self.exploredCells.update((cell, locationMap.get(cell)) for cell in visible)
+        return changed
+
+
+    # Draws everything in the window in the fog: the cells that have been seen, whichever is fewer to go
+    # through, the explored cells or the cells in the window. The rest stays black.
+    def drawFog(self, hero_obj, grid_obj):
+        self.screenSurface.fill(self.unexploredColor)
+        self.updateFieldOfView(hero_obj)
+        if len(self.exploredCells) <= grid_obj.viewWidth * grid_obj.viewHeight:
+            cells = [(x, y) for x, y in self.exploredCells if grid_obj.isVisible(x, y)]
+        else:
+            cells = [(x, y) for y in range(grid_obj.viewY, grid_obj.viewY + grid_obj.viewHeight)
+                     for x in range(grid_obj.viewX, grid_obj.viewX + grid_obj.viewWidth) if (x, y) in self.exploredCells]
+        for x, y in cells:
+            self.redrawCell(hero_obj, grid_obj, x, y)
 
 
 
     # This function draws the basic game screen.
+    # After a mode change or a scroll everything in the window is drawn,
+    # otherwise only the cells the player left and entered, and any that came into or went out of sight.
     def drawScreen(self, hero_obj, grid_obj):
-        self.screenSurface.fill(self.bgColor)
-        for treasure in self.treasureList:
-            grid_obj.blitSymbol(self, treasure.x_coord, treasure.y_coord, treasure.symbolSurface)
-        grid_obj.blitSymbol(self, hero_obj.x_coord, hero_obj.y_coord, hero_obj.symbolSurface)
+        playerCell = (hero_obj.x_coord, hero_obj.y_coord)
+        if grid_obj.followPlayer(hero_obj):
+            self.fullRedraw = True
+        if self.fullRedraw or not self.useDirtyRects:
+            if self.fogOfWar:
+                self.drawFog(hero_obj, grid_obj)
+            else:
+                self.screenSurface.fill(self.bgColor)
+                for treasure in grid_obj.getVisibleTreasures(self):
+                    grid_obj.blitSymbol(self, treasure.x_coord, treasure.y_coord, self.getSymbolSurface(treasure))
+                grid_obj.blitSymbol(self, hero_obj.x_coord, hero_obj.y_coord, hero_obj.symbolSurface)
+            self.markAllDirty()
+        else:
+            # In the fog, what can be seen only changes when the player moves or a treasure does.
+            if self.fogOfWar and (playerCell != self.lastPlayerCell or len(self.movedCells) > 0):
+                for x, y in self.updateFieldOfView(hero_obj):
+                    self.redrawCell(hero_obj, grid_obj, x, y)
+            if playerCell != self.lastPlayerCell:
+                if self.lastPlayerCell is not None:
+                    self.redrawCell(hero_obj, grid_obj, self.lastPlayerCell[0], self.lastPlayerCell[1])
+                self.redrawCell(hero_obj, grid_obj, playerCell[0], playerCell[1])
+            for x, y in self.movedCells:
+                self.redrawCell(hero_obj, grid_obj, x, y)
+        self.movedCells = []
+        self.lastPlayerCell = playerCell
 
 
     # These special draw functions call the regular drawScreen function,
     # then blit whatever else they need on top of it.
     def drawScreenMessage(self, hero_obj, grid_obj, textSurface):
+        redraw = self.fullRedraw or not self.useDirtyRects
         self.drawScreen(hero_obj, grid_obj)
-        self.blitMessage(textSurface)
+        # The message doesn't change while it is showing, so it only needs blitting once.
+        if redraw:
+            self.blitMessage(textSurface)
+
+
+    # The text screens never change while they are showing,
+    # so they are only drawn on the first frame after switching to them.
+    def drawTextScreen(self, textSurface):
+        if self.fullRedraw or not self.useDirtyRects:
+            self.screenSurface.fill((0, 0, 0))
+            self.blitMessage(textSurface)
+            self.markAllDirty()
 
 
     def drawScreenSplash(self, hero_obj, grid_obj):
-        self.screenSurface.fill((0, 0, 0))
-        self.blitMessage(self.splashSurface)
+        self.drawTextScreen(self.splashSurface)
 
 
     def drawScreenInstructions(self, hero_obj, grid_obj):
-        self.screenSurface.fill((0, 0, 0))
-        self.blitMessage(self.instructionsSurface)
+        self.drawTextScreen(self.instructionsSurface)
 
 
     def drawScreenWin(self, hero_obj, grid_obj):
-        self.screenSurface.fill((0, 0, 0))
-        self.blitMessage(self.winSurface)
+        self.drawTextScreen(self.winSurface)
 
 
     def drawScreenCredits(self, hero_obj, grid_obj):
-        self.screenSurface.fill((0, 0, 0))
-        self.blitMessage(self.creditsSurface)
+        self.drawTextScreen(self.creditsSurface)
 
 
 
 class GridCell():
     """A single cell in the game grid. Defined by its x and y coordinates in the grid, its x and y coorinates on the screen,
     and by its Rect."""
+    __slots__ = ('width', 'height', 'x_coord', 'y_coord', 'box')
+
     def __init__(self, settings_obj, x_loc, y_loc):
         self.width = settings_obj.cellWidth
         self.height = settings_obj.cellHeight
@@ -298,40 +1037,112 @@ class GridCell():
         pygame.draw.rect(settings_obj.screenSurface, color, self.box)
 
 
-    # This method will blit a specified surface onto the cell
+    # This method will blit a specified surface onto the cell. Only settings_obj.symbolArea of it is blitted,
+    # so nothing is drawn outside the cell.
     def blitSelf(self, settings_obj, symbolSurface):
-        settings_obj.screenSurface.blit(symbolSurface, self.box)
+        settings_obj.screenSurface.blit(symbolSurface, self.box, settings_obj.symbolArea)
 
 
 
 class GameGrid():
-    """The whole game grid. Contains a two-dimensional array of GridCell instances, and methods to deal with them."""
+    """The part of the game world that fits in the window. Only the cells on screen get a GridCell,
+    kept in a dictionary keyed by their position on screen, so a huge world costs no more than a small one.
+    viewX and viewY are the world grid coordinates shown in the top left cell. The methods take world
+    grid coordinates and quietly do nothing for locations that are scrolled off screen."""
     def __init__(self, settings_obj):
+        self.worldWidth = settings_obj.gridWidth
+        self.worldHeight = settings_obj.gridHeight
+        self.viewWidth = min(settings_obj.gridWidth, settings_obj.winWidth // settings_obj.cellWidth)
+        self.viewHeight = min(settings_obj.gridHeight, settings_obj.winHeight // settings_obj.cellHeight)
+        self.viewX = 0
+        self.viewY = 0
+        self.cellWidth = settings_obj.cellWidth
+        self.cellHeight = settings_obj.cellHeight
         self.grid = {}
-        for y in range(settings_obj.gridHeight):
-            for x in range(settings_obj.gridWidth):
+        for y in range(self.viewHeight):
+            for x in range(self.viewWidth):
                 coords = (x, y)
                 cell = GridCell(settings_obj, x, y)
                 self.grid[coords] = cell
 
-    # Picks a cell at random and fills it with red.
+    # True if the world location is in the window right now.
+    def isVisible(self, x_coord, y_coord):
+        return (self.viewX <= x_coord < self.viewX + self.viewWidth
+                and self.viewY <= y_coord < self.viewY + self.viewHeight)
+
+    # Returns the world grid location shown at a pixel position in the window, or None if there isn't one there.
+    def getGridLocation(self, x_pixel, y_pixel):
+        x_coord = x_pixel // self.cellWidth
+        y_coord = y_pixel // self.cellHeight
+        if 0 <= x_coord < self.viewWidth and 0 <= y_coord < self.viewHeight:
+            return (self.viewX + x_coord, self.viewY + y_coord)
+        return None
+
+    # Returns the GridCell a world location is drawn in, or None if it is off screen.
+    def getCell(self, x_coord, y_coord):
+        return self.grid.get((x_coord - self.viewX, y_coord - self.viewY)) if self.isVisible(x_coord, y_coord) else None
+
+    # Moves the camera so the world location is in the middle of the window, as far as the edges allow.
+    # Returns True if the camera moved.
+    def centerOn(self, x_coord, y_coord):
+        newX = max(0, min(x_coord - self.viewWidth // 2, self.worldWidth - self.viewWidth))
+        newY = max(0, min(y_coord - self.viewHeight // 2, self.worldHeight - self.viewHeight))
+        moved = (newX, newY) != (self.viewX, self.viewY)
+        self.viewX = newX
+        self.viewY = newY
+        return moved
+
+    # Scrolls the window when the player gets within a quarter screen of its edge.
+    # Jumping in big steps instead of every move keeps full redraws rare.
+    # Returns True if the camera moved.
+    def followPlayer(self, hero_obj):
+        marginX = self.viewWidth // 4
+        marginY = self.viewHeight // 4
+        if (hero_obj.x_coord < self.viewX + marginX or hero_obj.x_coord >= self.viewX + self.viewWidth - marginX
+                or hero_obj.y_coord < self.viewY + marginY or hero_obj.y_coord >= self.viewY + self.viewHeight - marginY):
+            return self.centerOn(hero_obj.x_coord, hero_obj.y_coord)
+        return False
+
+    # Returns the treasures that are on screen. Whichever is smaller gets looked through:
+    # the list of treasures, or the cells in the window.
+    def getVisibleTreasures(self, settings_obj):
+        if len(settings_obj.treasureList) <= self.viewWidth * self.viewHeight:
+            return [treasure for treasure in settings_obj.treasureList
+                    if self.isVisible(treasure.x_coord, treasure.y_coord)]
+        visible = []
+        for y in range(self.viewY, self.viewY + self.viewHeight):
+            for x in range(self.viewX, self.viewX + self.viewWidth):
+                treasure = settings_obj.getTreasureItemAt(x, y)
+                if treasure is not None:
+                    visible.append(treasure)
+        return visible
+
+    # Picks a cell on screen at random and fills it with red.
     def fillRandomCell(self, settings_obj):
-        randCell = (choice(range(settings_obj.gridWidth)), choice(range(settings_obj.gridHeight)))
+        randCell = (choice(range(self.viewWidth)), choice(range(self.viewHeight)))
         self.grid[randCell].fillBox(settings_obj, (255, 0, 0))
 
     # This will fill a specified cell with a specified color.
     def fillCell(self, settings_obj, x_coord, y_coord, color):
-        self.grid[tuple([x_coord, y_coord])].fillBox(settings_obj, color)
+        cell = self.getCell(x_coord, y_coord)
+        if cell is not None:
+            cell.fillBox(settings_obj, color)
 
     # This method blits a specified surface onto a specified cell
     def blitSymbol(self, settings_obj, x_coord, y_coord, symbolSurface):
-        self.grid[tuple([x_coord, y_coord])].blitSelf(settings_obj, symbolSurface)
+        cell = self.getCell(x_coord, y_coord)
+        if cell is not None:
+            cell.blitSelf(settings_obj, symbolSurface)
 
 
 
 class Player():
     """Stores information about the player. Since it has only data and no methods,
     I would probably make this a dictionary in the GameSettings class if I started again."""
+    __slots__ = ('x_coord', 'y_coord', 'color', 'symbol', 'collidingWith', 'symbolSurface',
+                 'moveUp', 'moveDown', 'moveLeft', 'moveRight', 'path', 'autoExplore', 'autopilot',
+                 'search', 'exploreTargets')
+
     def __init__(self, settings_obj, x_coord, y_coord):
         self.x_coord = x_coord
         self.y_coord = y_coord
@@ -343,30 +1154,338 @@ class Player():
         self.moveDown = False
         self.moveLeft = False
         self.moveRight = False
+        # The autopilot walks the player along path, a list of cells, by setting the move flags one tick at a time.
+        # With autoExplore on, it heads for the nearest treasure that hasn't been examined yet, over and over.
+        self.path = []
+        self.autoExplore = False
+        self.autopilot = False
+        # search is the PathSearch or NearestSearch working out the next path, if there is one going.
+        # exploreTargets are the treasures auto-explore heads for when there aren't any nearby.
+        self.search = None
+        self.exploreTargets = None
 
 
 
 class Treasure():
     """Stores information about one treasure item. Since it has only data and no methods,
-    I would probably make this a dictionary in the GameSettings class if I started again."""
-    def __init__(self, settings_obj, grid_obj, x_coord, y_coord, feline=False, text="This is a treasure."):
+    I would probably make this a dictionary in the GameSettings class if I started again.
+    There can be hundreds of thousands of these, so each one is kept small. __slots__ means there's no
+    dictionary for each one, and the text, color and symbol are just numbers: a text number for
+    GameSettings.getTreasureText() and positions in treasureColors and treasureSymbols.
+    The surfaces are shared by every treasure that looks the same or says the same thing,
+    and come from GameSettings.getSymbolSurface() and getTreasureTextSurface()."""
+    __slots__ = ('x_coord', 'y_coord', 'feline', 'examined', 'textIndex', 'colorIndex', 'symbolIndex', 'number')
+
+    def __init__(self, settings_obj, grid_obj, x_coord, y_coord, feline=False, textIndex=-1,
+                 colorIndex=None, symbolIndex=None):
         self.x_coord = x_coord
         self.y_coord = y_coord
-        self.color = settings_obj.getRandomColor()
-        self.text = text
         self.feline = feline
-        self.symbol = settings_obj.treasureSymbols[randint(0, len(settings_obj.treasureSymbols) - 1)]
-        self.textSurface = settings_obj.createTextSprite(self.text)
-        self.symbolSurface = settings_obj.createSymbolSprite(self)
+        # Set once the player has bumped into it.
+        self.examined = False
+        self.textIndex = textIndex
+        # Its place in GameSettings.boardSnapshot, set by GameSettings.buildBoard().
+        self.number = -1
+        # If the color and symbol weren't picked already, they are picked at random.
+        if colorIndex is None:
+            colorIndex = settings_obj.getRandomColorIndex()
+        self.colorIndex = colorIndex
+        if symbolIndex is None:
+            symbolIndex = settings_obj.rng.randrange(len(settings_obj.treasureSymbols))
+        self.symbolIndex = symbolIndex
+
+
+
+class GameSession():
+    """Everything for one run of the program. The GameSettings, with pygame, the fonts, the rendered
+    screens and the treasure texts, is only set up once. Each new game just gets a new board
+    of treasures and a new Player, so playing again is quick and doesn't pile up on the stack.
+    While the win and credits screens are up, the next board is planned on another thread, and built
+    as soon as the plan is ready, so playing again only has to swap it in.
+    Saving packs the game up on the main thread, which is quick, and writes the file on another thread.
+    If snapshot is given, the game carries on from it instead of starting a new board."""
+    def __init__(self, startMode, options=None, snapshot=None):
+        # initialize game settings
+        self.settings = GameSettings(startMode, options)
+        # initialize the grid
+        self.grid = GameGrid(self.settings)
+        self.hero = None
+        # boardPlanner runs planBoard() in the background. nextPlan is its Future, and nextBoard
+        # is the board built from it by GameSettings.buildBoard(), ready to swap in.
+        self.boardPlanner = ThreadPoolExecutor(max_workers=1)
+        self.nextPlan = None
+        self.nextBoard = None
+        # saveWriter writes save files in the background, one at a time.
+        self.saveWriter = ThreadPoolExecutor(max_workers=1)
+        self.nextAutosave = time.perf_counter() + self.settings.autosaveInterval
+        if snapshot is not None:
+            self.restoreGame(snapshot)
+        else:
+            self.newBoard()
+
+
+    # Starts planning the next board on the other thread, if it isn't already.
+    def prepareNextBoard(self):
+        if self.nextPlan is None:
+            self.settings.plannedRngState = self.settings.rng.getstate()
+            self.nextPlan = self.boardPlanner.submit(self.planNextBoard)
+
+
+    # This runs on the other thread. When the plan is ready, it wakes up the main loop, which may be waiting for a key.
+    def planNextBoard(self):
+        plan = self.settings.planBoard()
+        pygame.event.post(pygame.event.Event(USEREVENT))
+        return plan
+
+
+    # Builds the next board, once its plan is ready.
+    def finishNextBoard(self):
+        if self.nextPlan is not None and self.nextBoard is None and self.nextPlan.done():
+            items, playerStart = self.nextPlan.result()
+            self.nextBoard = self.settings.buildBoard(items, playerStart, self.grid)
+
+
+    # Clears out the old board and makes a new one, or swaps in the one that was built ahead of time.
+    def newBoard(self):
+        settings = self.settings
+        if self.nextPlan is not None:
+            items, playerStart = self.nextPlan.result()
+            if self.nextBoard is None:
+                # The key was pressed before the board was built, so wait for the plan and build it now.
+                self.nextBoard = settings.buildBoard(items, playerStart, self.grid)
+            board = self.nextBoard
+            self.nextPlan = None
+            self.nextBoard = None
+        else:
+            # make up all the treasures
+            items, playerStart = settings.planBoard()
+            board = settings.buildBoard(items, playerStart, self.grid)
+
+        oldTreasures = settings.treasureList
+        oldLocations = settings.locationMap
+        settings.resetBoard()
+        self.grid.centerOn(0, 0)
+        # place all the treasures
+        settings.useBoard(board)
+        self.boardPlanner.submit(self.releaseBoard, oldTreasures, oldLocations, items)
+
+        # the player starts in the location that was picked for them along with the treasures.
+        start_x, start_y = settings.playerStart
+        # create an instance of the Player object.
+        self.hero = Player(settings, start_x, start_y)
+
+
+    # Lets go of the last board's treasures, and the plan the new one was built from, a thousand at a time.
+    # This runs on the boardPlanner thread, since throwing away a huge board all at once would hold up the
+    # first frame of the next one.
+    def releaseBoard(self, treasureList, locationMap, items):
+        while len(locationMap) > 0:
+            for i in range(min(1000, len(locationMap))):
+                locationMap.popitem()
+        for contents in (treasureList, items):
+            while len(contents) > 0:
+                del contents[-1000:]
+
+
+    # Puts the game back the way it was when the snapshot was saved. Nothing is rendered here:
+    # like any other board, only what's on screen gets drawn, when it's drawn.
+    def restoreGame(self, snapshot):
+        settings = self.settings
+        settings.resetBoard()
+        settings.seed = snapshot.seed
+        settings.rng.setstate((3, tuple(snapshot.rngState), None))
+        textCount = len(settings.treasureTexts)
+        treasures = []
+        for x, y, flags, textIndex, colorIndex, symbolIndex in snapshot.getTreasures():
+            # If treasures.txt has changed since, the text numbers are made to fit, so the game still works.
+            if snapshot.textCount != textCount and textIndex != settings.felineTextIndex:
+                textIndex %= textCount
+            treasure = Treasure(settings, self.grid, x, y, bool(flags & GameSnapshot.FELINE), textIndex, colorIndex, symbolIndex)
+            treasure.examined = bool(flags & GameSnapshot.EXAMINED)
+            treasures.append(treasure)
+        for treasure in treasures:
+            settings.addTreasure(treasure)
+        settings.boardSnapshot = snapshot
+        for number, treasure in enumerate(treasures):
+            treasure.number = number
+        settings.playerStart = (snapshot.playerX, snapshot.playerY)
+        self.hero = Player(settings, snapshot.playerX, snapshot.playerY)
+        if snapshot.collidingWith >= 0:
+            self.hero.collidingWith = treasures[snapshot.collidingWith]
+        self.grid.centerOn(snapshot.playerX, snapshot.playerY)
+        settings.changeMode(snapshot.mode)
+        settings.fullRedraw = True
+
+
+    # Saves the game to settings.saveFilename. The file is written on the saveWriter thread, so the game doesn't
+    # wait for the disk. Saves are written in the order they're made, so the newest always ends up in the file.
+    def saveGame(self):
+        settings = self.settings
+        settings.saveRequested = False
+        if settings.boardSnapshot is None:
+            return
+        self.saveWriter.submit(writeSaveFile, settings.saveFilename, settings.packSaveData(self.hero))
+
+
+    # Saves the game if F5 was pressed, or if it's time for an autosave.
+    def saveIfDue(self):
+        settings = self.settings
+        if settings.saveRequested:
+            self.saveGame()
+        elif settings.autosaveInterval > 0 and time.perf_counter() >= self.nextAutosave:
+            self.saveGame()
+            self.nextAutosave = time.perf_counter() + settings.autosaveInterval
+
+
+    # Calls the input function for the current game mode.
+    def handleInput(self):
+        settings = self.settings
+        hero = self.hero
+        if settings.gameMode in settings.idleModes:
+            settings.waitForInput()
+            # Time spent away from play mode doesn't count towards catching up on ticks.
+            settings.tickScheduler.reset()
+        if settings.gameMode == 'play':
+            getInputEventsPlay(settings, hero, self.grid)
+        else:
+            if settings.gameMode in ('win', 'credits'):
+                # Get the next board ready while the player is looking at these screens.
+                self.prepareNextBoard()
+                self.finishNextBoard()
+            getInputEventsKeyPress(settings)
+            self.startRequestedGame()
+
+
+    # If a new game was asked for on the win screen, makes the new board and starts playing it.
+    def startRequestedGame(self):
+        if self.settings.newGameRequested:
+            self.newBoard()
+            self.settings.changeMode('play')
+
+
+    # Runs as many ticks of the game logic as are due. Only play mode has any.
+    def updateLogic(self):
+        settings = self.settings
+        if settings.gameMode == 'play':
+            for tick in range(settings.tickScheduler.getTicksDue()):
+                hero = self.hero
+                steerPlayer(settings, hero)
+                if settings.recorder is not None:
+                    settings.recorder.recordTick(hero.moveUp, hero.moveDown, hero.moveLeft, hero.moveRight)
+                updatePlay(settings, self.hero)
+                if settings.gameMode != 'play':
+                    break
+                wanderTreasures(settings, hero, self.grid)
+
+
+    # Calls the drawing function for the current game mode.
+    def drawFrame(self):
+        settings = self.settings
+        hero = self.hero
+        grid = self.grid
+        if settings.gameMode == 'play':
+            settings.drawScreen(hero, grid)
+        elif settings.gameMode == 'message':
+            settings.drawScreenMessage(hero, grid, settings.getTreasureTextSurface(hero.collidingWith))
+        elif settings.gameMode == 'splash':
+            settings.drawScreenSplash(hero, grid)
+        elif settings.gameMode == 'instructions':
+            settings.drawScreenInstructions(hero, grid)
+        elif settings.gameMode == 'win':
+            settings.drawScreenWin(hero, grid)
+        elif settings.gameMode == 'credits':
+            settings.drawScreenCredits(hero, grid)
+
+
+    # Game loop calls the appropriate input, logic and drawing functions for the current game mode.
+    # If the profiler is switched on, it times each part of every frame.
+    def run(self):
+        settings = self.settings
+        profiler = settings.profiler
+        while True:
+            if profiler is not None:
+                profiler.startFrame(settings.gameMode)
+            self.handleInput()
+            if profiler is not None:
+                profiler.mark('input')
+            self.updateLogic()
+            self.saveIfDue()
+            if profiler is not None:
+                profiler.mark('update')
+            self.drawFrame()
+            if profiler is not None:
+                profiler.drawHud(settings)
+                profiler.mark('draw')
+
+            settings.updateDisplay()
+            if profiler is not None:
+                profiler.mark('display')
+
+            settings.clock.tick(settings.frameRate)
+            if profiler is not None:
+                profiler.mark('sleep')
+                profiler.endFrame()
+
+
+    # Plays back a recorded session as fast as it can, through the same game logic as a live game.
+    # events comes from clfcore.readInputLog(). If render is True, every tick and key press is drawn too.
+    # Returns a dictionary saying how it went, which is handy for checking two runs came out the same.
+    def replay(self, events, render=True):
+        settings = self.settings
+        ticks = 0
+        keys = 0
+        boards = 1
+        startTime = time.perf_counter()
+        for event in events:
+            if event[0] == 'ticks':
+                moveUp, moveDown, moveLeft, moveRight = event[1]
+                for tick in range(event[2]):
+                    hero = self.hero
+                    hero.moveUp, hero.moveDown, hero.moveLeft, hero.moveRight = moveUp, moveDown, moveLeft, moveRight
+                    updatePlay(settings, hero)
+                    if settings.gameMode == 'play':
+                        wanderTreasures(settings, hero, self.grid)
+                    if render:
+                        self.drawFrame()
+                        settings.updateDisplay()
+                        pygame.event.pump()
+                ticks += event[2]
+            else:
+                if getModeAfterKey(settings.gameMode, event[1]) == 'quit':
+                    break
+                applyModeKey(settings, event[1])
+                if settings.newGameRequested:
+                    boards += 1
+                self.startRequestedGame()
+                keys += 1
+                if render:
+                    self.drawFrame()
+                    settings.updateDisplay()
+                    pygame.event.pump()
+        seconds = time.perf_counter() - startTime
+        return {'ticks': ticks, 'keys': keys, 'boards': boards, 'seconds': seconds,
+                'ticksPerSecond': ticks / seconds if seconds > 0 else 0.0,
+                'mode': settings.gameMode, 'player': (self.hero.x_coord, self.hero.y_coord)}
 
 
 
 # Here is a function for processing input while the game is in play mode.
-def getInputEventsPlay(settings_obj, player_obj):
-    for event in pygame.event.get():
+# It only keeps track of which arrow keys are held down. updatePlay() does the moving.
+def getInputEventsPlay(settings_obj, player_obj, grid_obj):
+    for event in settings_obj.getEvents():
         if event.type == QUIT:
             settings_obj.quitGame()
+        if event.type == VIDEOEXPOSE:
+            # Another window was in the way, and only the cells that change get updated, so draw everything again.
+            settings_obj.fullRedraw = True
         if event.type == KEYDOWN:
+            if event.key in (K_DOWN, K_UP, K_LEFT, K_RIGHT):
+                # Taking over from the autopilot.
+                stopAutopilot(player_obj)
+            if event.key == K_a:
+                player_obj.autoExplore = not player_obj.autoExplore
+                if not player_obj.autoExplore:
+                    stopAutopilot(player_obj)
             if event.key == K_DOWN:
                 player_obj.moveDown = True
             if event.key == K_UP:
@@ -375,6 +1494,10 @@ def getInputEventsPlay(settings_obj, player_obj):
                 player_obj.moveLeft = True
             if event.key == K_RIGHT:
                 player_obj.moveRight = True
+            if event.key == K_F3 and settings_obj.profiler is not None:
+                settings_obj.profiler.toggleHud(settings_obj)
+            if event.key == K_F5:
+                settings_obj.saveRequested = True
         if event.type == KEYUP:
             if event.key == K_DOWN:
                 player_obj.moveDown = False
@@ -384,31 +1507,127 @@ def getInputEventsPlay(settings_obj, player_obj):
                 player_obj.moveLeft = False
             if event.key == K_RIGHT:
                 player_obj.moveRight = False
-
+        if event.type == MOUSEBUTTONDOWN and event.button == 1:
+            # Clicking on a cell walks the player there, or to bump into whatever is there.
+            target = grid_obj.getGridLocation(event.pos[0], event.pos[1])
+            if target is not None:
+                stopAutopilot(player_obj)
+                planPath(settings_obj, player_obj, target,
+                         settings_obj.clickSearchScreens * grid_obj.viewWidth * grid_obj.viewHeight)
+
+
+# Switches the autopilot off and lets go of the keys it was holding.
+def stopAutopilot(player_obj):
+    player_obj.path = []
+    player_obj.search = None
+    player_obj.autoExplore = False
+    releaseAutopilotKeys(player_obj)
+
+
+# Lets go of the arrow keys, if the autopilot was the one holding them down.
+def releaseAutopilotKeys(player_obj):
+    if player_obj.autopilot:
+        player_obj.moveUp = player_obj.moveDown = player_obj.moveLeft = player_obj.moveRight = False
+        player_obj.autopilot = False
+
+
+# Starts the autopilot looking for a path to target, giving up after maxSearch cells. steerPlayer() does the searching.
+def planPath(settings_obj, player_obj, target, maxSearch=250000):
+    player_obj.search = PathSearch((player_obj.x_coord, player_obj.y_coord), target, settings_obj.gridWidth,
+                                   settings_obj.gridHeight, settings_obj.locationMap, maxSearch)
+
+
+# Starts the autopilot looking for the nearest treasure the player hasn't examined yet. First it searches outwards
+# a little way, which finds it quickly when there are treasures close by. If that doesn't find one,
+# planNextExploreTarget() heads for the closest ones as the crow flies instead.
+def planExplore(settings_obj, player_obj):
+    locationMap = settings_obj.locationMap
+    player_obj.search = NearestSearch((player_obj.x_coord, player_obj.y_coord), settings_obj.gridWidth,
+                                      settings_obj.gridHeight, locationMap, lambda cell: not locationMap[cell].examined,
+                                      settings_obj.exploreSearchSize)
+    player_obj.exploreTargets = None
+
+
+# Starts a path search to the next of the five unexamined treasures closest to the player as the crow flies,
+# after the search nearby didn't find one, or there was no way to the last one tried.
+# Returns False if there aren't any left to try.
+def planNextExploreTarget(settings_obj, player_obj):
+    if player_obj.exploreTargets is None:
+        x_coord = player_obj.x_coord
+        y_coord = player_obj.y_coord
+        player_obj.exploreTargets = heapq.nsmallest(5, [treasure for treasure in settings_obj.treasureList if not treasure.examined],
+                                                    key=lambda treasure: abs(treasure.x_coord - x_coord) + abs(treasure.y_coord - y_coord))
+    if len(player_obj.exploreTargets) == 0:
+        return False
+    treasure = player_obj.exploreTargets.pop(0)
+    planPath(settings_obj, player_obj, (treasure.x_coord, treasure.y_coord))
+    return True
+
+
+# The autopilot takes the next step along the player's path by holding down the arrow key that points that way for one tick.
+# It works through the move flags, just like a player would, so recordings of it replay the same way.
+# While a path is still being searched for, it looks through pathSearchBudget more cells each tick, and the player waits.
+def steerPlayer(settings_obj, player_obj):
+    if len(player_obj.path) == 0 and player_obj.search is None and player_obj.autoExplore:
+        planExplore(settings_obj, player_obj)
+    search = player_obj.search
+    if search is not None:
+        if not search.run(settings_obj.pathSearchBudget):
+            releaseAutopilotKeys(player_obj)
+            return
+        player_obj.search = None
+        if search.path is not None:
+            player_obj.path = search.path
+        elif player_obj.autoExplore and planNextExploreTarget(settings_obj, player_obj):
+            releaseAutopilotKeys(player_obj)
+            return
+        else:
+            player_obj.autoExplore = False
+    if len(player_obj.path) == 0:
+        if player_obj.autopilot:
+            stopAutopilot(player_obj)
+        return
+    next_x, next_y = player_obj.path[0]
+    step = (next_x - player_obj.x_coord, next_y - player_obj.y_coord)
+    if step not in ((0, -1), (0, 1), (-1, 0), (1, 0)):
+        # Something got in the way and the path doesn't fit any more, so work out a new one next tick.
+        player_obj.path = []
+        return
+    player_obj.moveUp = step == (0, -1)
+    player_obj.moveDown = step == (0, 1)
+    player_obj.moveLeft = step == (-1, 0)
+    player_obj.moveRight = step == (1, 0)
+    player_obj.autopilot = True
+
+
+# This is one tick of the game logic in play mode. While a direction is held, the player moves one cell every tick.
+# It runs at settings_obj.tickRate ticks per second no matter how fast the screen is being drawn.
+def updatePlay(settings_obj, player_obj):
     # player_dest will store the player's destination and check it before committing the move.
-    player_dest = [player_obj.x_coord, player_obj.y_coord]
-
-    # move the player, if the move won't put them off the screen.
-    if player_obj.moveDown and player_obj.y_coord < settings_obj.gridHeight - 1:
-        player_dest = [player_obj.x_coord, player_obj.y_coord + 1]
-    if player_obj.moveUp and player_obj.y_coord > 0:
-        player_dest = [player_obj.x_coord, player_obj.y_coord - 1]
-    if player_obj.moveLeft and player_obj.x_coord > 0:
-        player_dest = [player_obj.x_coord - 1, player_obj.y_coord]
-    if player_obj.moveRight and player_obj.x_coord < settings_obj.gridWidth - 1:
-        player_dest = [player_obj.x_coord + 1, player_obj.y_coord]
+    # The move won't put them off the screen. The rule is shared with the simulated games in clfcore.
+    player_dest = getMoveDestination(player_obj.x_coord, player_obj.y_coord,
+                                     player_obj.moveUp, player_obj.moveDown, player_obj.moveLeft, player_obj.moveRight,
+                                     settings_obj.gridWidth, settings_obj.gridHeight)
 
     # check if the player is bumping into any treasure items
-    if player_dest not in settings_obj.locationList:
+    if not settings_obj.isOccupied(player_dest[0], player_dest[1]):
         # not colliding, so commit move
         player_obj.x_coord = player_dest[0]
         player_obj.y_coord = player_dest[1]
         player_obj.collidingWith = None
+        # if the autopilot made that step, it's done with it.
+        if len(player_obj.path) > 0 and player_obj.path[0] == player_dest:
+            del player_obj.path[0]
     else:
-        # set all player movement directions to false.
+        # set all player movement directions to false, and stop any path being followed.
         player_obj.moveUp = player_obj.moveDown = player_obj.moveLeft = player_obj.moveRight = False
+        player_obj.path = []
+        player_obj.autopilot = False
         # colliding with something, check what it is.
         item = settings_obj.getTreasureItemAt(player_dest[0], player_dest[1])
+        if not item.examined:
+            item.examined = True
+            settings_obj.examinedTreasures.append(item)
         player_obj.collidingWith = item
         if not item.feline:
             # not colliding with feline, so go to message mode to show item's description
@@ -417,162 +1636,179 @@ def getInputEventsPlay(settings_obj, player_obj):
             # colliding with feline, so go to win mode
             settings_obj.changeMode('win')
 
-# Here is a function for processing input while in message mode.
-# Pressing any key will continue the game.
-def getInputEventsMessage(settings_obj):
-    for event in pygame.event.get():
-        if event.type == QUIT:
-            settings_obj.quitGame()
-        elif event.type == KEYDOWN:
-            settings_obj.changeMode('play')
-
-# Here is a function for processing input while in splash mode.
-# Pressing 'i' switches to instructions mode, any other key starts game.
-def getInputEventsSplash(settings_obj):
-    for event in pygame.event.get():
-        if event.type == QUIT:
-            settings_obj.quitGame()
-        elif event.type == KEYDOWN:
-            if event.key == K_i:
-                settings_obj.changeMode('instructions')
-            else:
-                settings_obj.changeMode('play')
-
-# Here is a function for processing input while in instructions mode.
-# Pressing any key will start the game.
-def getInputEventsInstructions(settings_obj):
-    for event in pygame.event.get():
-        if event.type == QUIT:
-            settings_obj.quitGame()
-        elif event.type == KEYDOWN:
-            settings_obj.changeMode('play')
-
-# Here is a function for processing input while in win mode.
-# Pressing 'c' shows the credits, 'q' quits the program,
-# any other key starts a new game.
-def getInputEventsWin(settings_obj):
-    for event in pygame.event.get():
-        if event.type == QUIT:
-            settings_obj.quitGame()
-        elif event.type == KEYDOWN:
-            if event.key == K_c:
-                settings_obj.changeMode('credits')
-            elif event.key == K_q:
-                settings_obj.quitGame()
-            else:
-                newGameStart('play')
-
-# Here is a function for processing input in credits mode.
-# Pressing any key takes you back to win mode.
-def getInputEventsCredits(settings_obj):
-    for event in pygame.event.get():
+# This is the treasures' part of a tick, when they wander. It runs after the player has moved, so treasures step
+# around the player rather than the other way round. The ones that try to move are picked at random without
+# going through the whole treasureList, at most wanderLimit of them unless it's 0, and clfcore.wanderStep does
+# the moving against the locationMap.
+def wanderTreasures(settings_obj, player_obj, grid_obj):
+    if settings_obj.wanderMode == 'off':
+        return
+    rng = settings_obj.rng
+    if settings_obj.wanderMode == 'sample':
+        treasureList = settings_obj.treasureList
+        count = int(len(treasureList) * settings_obj.wanderChance + rng.random())
+        if settings_obj.wanderLimit > 0:
+            count = min(settings_obj.wanderLimit, count)
+        movers = rng.sample(treasureList, count)
+    elif settings_obj.felineTreasure is not None and rng.random() < settings_obj.wanderChance:
+        movers = [settings_obj.felineTreasure]
+    else:
+        return
+    locationMap = settings_obj.locationMap
+    moves = wanderStep([(treasure.x_coord, treasure.y_coord) for treasure in movers], locationMap,
+                       settings_obj.gridWidth, settings_obj.gridHeight, (player_obj.x_coord, player_obj.y_coord), rng)
+    movedCells = settings_obj.movedCells
+    snapshot = settings_obj.boardSnapshot
+    for old, new in moves:
+        treasure = locationMap[new]
+        treasure.x_coord, treasure.y_coord = new
+        snapshot.moveTreasure(treasure.number, new[0], new[1])
+        # Only moves on screen need drawing, and once there are more of them than cells on screen
+        # it's quicker to redraw the lot.
+        if not settings_obj.fullRedraw and (grid_obj.isVisible(old[0], old[1]) or grid_obj.isVisible(new[0], new[1])):
+            movedCells.append(old)
+            movedCells.append(new)
+            if len(movedCells) > grid_obj.viewWidth * grid_obj.viewHeight:
+                settings_obj.fullRedraw = True
+                del movedCells[:]
+
+# Here is a function for processing input in the modes that just wait for a key press:
+# splash, instructions, message, win and credits. What each key does is in clfcore.modeKeys.
+def getInputEventsKeyPress(settings_obj):
+    for event in settings_obj.getEvents():
         if event.type == QUIT:
             settings_obj.quitGame()
         elif event.type == KEYDOWN:
-                settings_obj.changeMode('win')
-
-# Calling this starts a new game. Originally, this was main(), but I changed it, because now calling
-# newGameStart(startMode) is the simplest way to start a new game after winning.
-def newGameStart(startMode):
-    # initialize game settings
-    settings = GameSettings(startMode)
-
-    # initialize the grid
-    grid = GameGrid(settings)
-
-    # make up and place all the treasures
-    settings.populateTreasureList(grid)
-
-    # get a random location for the player to start in.
-    start_x, start_y = settings.getRandomCoordinates()
-    while [start_x, start_y] in settings.locationList:
-        start_x, start_y = settings.getRandomCoordinates()
-    # create an instance of the Player object.
-    hero = Player(settings, start_x, start_y)
-
-    # Game loop calls the appropriate input and drawing functions for the current game mode.
-    while True:
-        if settings.gameMode == 'play':
-            getInputEventsPlay(settings, hero)
-            settings.drawScreen(hero, grid)
-        elif settings.gameMode == 'message':
-            getInputEventsMessage(settings)
-            settings.drawScreenMessage(hero, grid, hero.collidingWith.textSurface)
-        elif settings.gameMode == 'splash':
-            getInputEventsSplash(settings)
-            settings.drawScreenSplash(hero, grid)
-        elif settings.gameMode == 'instructions':
-            getInputEventsInstructions(settings)
-            settings.drawScreenInstructions(hero, grid)
-        elif settings.gameMode == 'win':
-            getInputEventsWin(settings)
-            settings.drawScreenWin(hero, grid)
-        elif settings.gameMode == 'credits':
-            getInputEventsCredits(settings)
-            settings.drawScreenCredits(hero, grid)
-
-        pygame.display.update()
-
-        settings.clock.tick(15)
-
-# This returns a dictionary with keys for the four screens described.
-# The keys hold a list of strings, one for each line that will need to
-# be rendered.
-def getASCIIScreens():
-    splash = [
-        r"  ___  _   _____   ___  ____   ___  ",
-        r" // \\ \\ //|| \\ // \\ || \\ // \\ ",
-        r" ||     \V/ ||_// || || ||_// ||___ ",
-        r" ||     //  || \\ || || ||\\  || || ",
-        r" \\_// //   ||_// \\_// || \\ \\_// ",
-        r"          _   _   _  ___ __  _      ",
-        r"      |  / \ /   /_\  |  |_ /_      ",
-        r"      |_ \_/ \_ /   \ |  |_ _/      ",
-        r" _____ _____ _     _  ___  _  _____ ",
-        r" ||    ||    ||    || ||\\ || ||    ",
-        r" ||__  ||__  ||    || || \\|| ||__  ",
-        r" ||    ||    ||    || ||  \|| ||    ",
-        r" ||    ||___ ||___ || ||   || ||___ ",
-        r"                                    ",
-        r"      'I' for instructions.         ",
-        r"     Any other key to start.        "
-    ]
-    instructions = [
-        "You are cyborg. You look like this - @",
-        "Your visual sensors are on the fritz.",
-        "You see things, by can't identify them.",
-        "What's worse, feline is missing!",
-        "To find out what something is, use the arrow keys",
-        "to move around until you bump into it.",
-        "With persistence, you will find feline in no time!",
-        " ",
-        "Any key to start."
-    ]
-    win = [
-        " It is feline! You are reunited at last! ",
-        "                 __ __                   ",
-        "                /##V##\   |              ",
-        "           ^_^  \#####/   0              ",
-        "           0 0   \###/  >-#-<            ",
-        "          >\I/<   \#/    _^_             ",
-        "                   V    (0o0)            ",
-        "                                         ",
-        "              'Q' to quit.               ",
-        "            'C' for credits.             ",
-        "      Any other key to play again.       "
-    ]
-    credits = [
-        "Made by Eric Shumaker using",
-        "Python 3.5.1, Pygame 1.9.2, and the",
-        "LiberationMono-Bold.ttf font.",
-        " ",
-        "Inspired by 'robotfindskitten'",
-        "by Leonard Richardson (crummy.com)."
-    ]
-    return {'splash': splash, 'instructions': instructions, 'win': win, 'credits': credits}
+            applyModeKey(settings_obj, pygame.key.name(event.key))
+
+# Does whatever pressing the key does in the current mode. keyName is the key's name, like 'i'.
+# Replaying a recorded session calls this too, so it goes through exactly the same steps.
+def applyModeKey(settings_obj, keyName):
+    if settings_obj.recorder is not None:
+        settings_obj.recorder.recordKey(keyName)
+    newMode = getModeAfterKey(settings_obj.gameMode, keyName)
+    if newMode == 'quit':
+        settings_obj.quitGame()
+    elif newMode == 'newgame':
+        settings_obj.requestNewGame()
+    else:
+        settings_obj.changeMode(newMode)
+
+# Calling this starts the game. Originally, this was main(), and it was called again to start a new game
+# after winning. Now the GameSession takes care of new games itself, without setting up pygame again.
+def newGameStart(startMode, options=None):
+    session = GameSession(startMode, options)
+    session.run()
+
+# Makes sure the asset bundle is up to date, without playing.
+# No window is needed for this, so it uses SDL's dummy video driver unless told otherwise.
+def buildAssetBundle():
+    os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+    settings = GameSettings('splash')
+    if settings.bundleLoaded:
+        print(settings.bundleFilename + " is already up to date.")
+    else:
+        print("Built " + settings.bundleFilename + ".")
+    pygame.quit()
+
+
+# Plays back a recording made with --record, using the seed, board and wander settings it was made with.
+# Recordings from before the wander settings were noted down use the ones on the command line instead.
+def replaySession(options):
+    try:
+        recorded, events = readInputLog(options.replay)
+    except (OSError, ValueError) as error:
+        print("Can't replay the recording: " + str(error), file=sys.stderr)
+        sys.exit(1)
+    if options.no_render:
+        os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+    options.seed = recorded['seed']
+    options.width = recorded['gridWidth']
+    options.height = recorded['gridHeight']
+    options.treasures = recorded['numOfTreasures']
+    if 'wanderMode' in recorded:
+        options.wander = recorded['wanderMode']
+        options.wander_chance = recorded['wanderChance']
+        options.wander_limit = recorded['wanderLimit']
+    options.record = None
+    session = GameSession(recorded['startMode'], options)
+    results = session.replay(events, not options.no_render)
+    print("Replayed {ticks} ticks and {keys} key presses over {boards} boards in {seconds:.3f} seconds "
+          "({ticksPerSecond:.0f} ticks per second).".format(**results))
+    print("Finished in {} mode with the player at {}.".format(results['mode'], results['player']))
+    pygame.quit()
+
+
+# Carries on a game saved with F5 or by autosaving, with the board size and seed it was saved with.
+def resumeSession(options):
+    try:
+        snapshot = readSaveFile(options.resume)
+    except (OSError, ValueError) as error:
+        print("Can't resume the game: " + str(error), file=sys.stderr)
+        sys.exit(1)
+    options.seed = snapshot.seed
+    options.width = snapshot.gridWidth
+    options.height = snapshot.gridHeight
+    options.treasures = snapshot.numOfTreasures
+    if options.save is None:
+        options.save = options.resume
+    session = GameSession(snapshot.mode, options, snapshot)
+    session.run()
 
 
 def main():
-    newGameStart('splash')
+    parser = argparse.ArgumentParser(description="Cyborg Locates Feline")
+    parser.add_argument('--build-bundle', action='store_true',
+                        help="make the asset bundle, so the game starts faster, then exit")
+    parser.add_argument('--profile', action='store_true',
+                        help="time each part of every frame and show the times on screen (F3 hides them)")
+    parser.add_argument('--profile-csv', metavar='FILE',
+                        help="time each part of every frame and write the times to a CSV file")
+    parser.add_argument('--width', type=int, help="how many cells wide the world is (default 40)")
+    parser.add_argument('--height', type=int, help="how many cells high the world is (default 40)")
+    parser.add_argument('--treasures', type=int, help="how many treasures to place, counting feline (default 20)")
+    parser.add_argument('--seed', type=int, help="seed for the random numbers, to get the same boards every time")
+    parser.add_argument('--record', metavar='FILE', help="record everything the player does to a file")
+    parser.add_argument('--replay', metavar='FILE', help="play back a recording as fast as possible, then exit")
+    parser.add_argument('--no-render', action='store_true', help="don't draw anything while replaying")
+    parser.add_argument('--save', metavar='FILE', help="where F5 and autosaving save the game (default clf.save)")
+    parser.add_argument('--autosave', type=float, metavar='SECONDS',
+                        help="how often to save the game while playing, 0 for never (default 60)")
+    parser.add_argument('--resume', metavar='FILE', help="carry on a saved game")
+    parser.add_argument('--wander', choices=wanderModes,
+                        help="let feline, or a random sample of everything, wander around the board")
+    parser.add_argument('--wander-chance', type=float, metavar='CHANCE',
+                        help="how likely each wandering treasure is to take a step each tick (default 0.25)")
+    parser.add_argument('--wander-limit', type=int, metavar='COUNT',
+                        help="the most treasures that try to move on one tick with '--wander sample', "
+                             "0 for no limit (default 2000)")
+    parser.add_argument('--fog', action='store_true', help="only show what cyborg's sensors can reach")
+    parser.add_argument('--sight', type=int, help="how many cells cyborg can see in the fog (default 8)")
+    args = parser.parse_args()
+    # The same defaults GameSettings has.
+    width = 40 if args.width is None else args.width
+    height = 40 if args.height is None else args.height
+    treasures = 20 if args.treasures is None else args.treasures
+    if width < 1 or height < 1:
+        parser.error("--width and --height have to be at least 1")
+    if treasures < minTreasures:
+        parser.error("--treasures has to be at least %d, counting feline" % minTreasures)
+    if treasures > width * height:
+        parser.error("there isn't room for %d treasures on a %dx%d board" % (treasures, width, height))
+    if args.wander_chance is not None and not 0 <= args.wander_chance <= 1:
+        parser.error("--wander-chance has to be between 0 and 1")
+    if args.wander_limit is not None and args.wander_limit < 0:
+        parser.error("--wander-limit can't be negative")
+    if args.resume is not None and args.record is not None:
+        parser.error("a resumed game can't be recorded, since the recording has to start from a new board")
+    if args.build_bundle:
+        buildAssetBundle()
+    elif args.replay is not None:
+        replaySession(args)
+    elif args.resume is not None:
+        resumeSession(args)
+    else:
+        newGameStart('splash', args)
 
-main()
+if __name__ == '__main__':
+    main()
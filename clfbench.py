@@ -0,0 +1,224 @@
+#! /usr/bin/python3
+
+# Programmer: Eric Shumaker
+# File: clfbench.py
+# Language Version: Python 3.5.1
+# Depends On:   Pygame 1.9.2,
+#               clf.py
+#
+# Times the parts of the game that run the most, with SDL's dummy video driver so no window is needed.
+# Each benchmark is run on a range of grid sizes and numbers of treasures, and the results are written
+# as JSON. Give it a saved set of results with --compare and it will point out anything that got slower.
+
+import os, sys, gc, json, time, random, platform, argparse
+
+# These have to be set before pygame starts up.
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+os.environ.setdefault('SDL_AUDIODRIVER', 'dummy')
+# clf.py looks for its font and treasures.txt in the current directory.
+os.chdir(os.path.dirname(os.path.abspath(__file__)))
+
+import pygame
+import clf
+
+
+# Grid sizes and treasure counts for each run. The full run goes up to a 4000x4000 grid.
+gridSizes = {'quick': [40, 400], 'full': [40, 400, 4000]}
+treasureCounts = {'quick': [20, 1000], 'full': [20, 1000, 10000]}
+
+
+# Runs func number times in a row, repeat times over, and returns the times for one call, in seconds.
+# setup is called before each repeat, and isn't timed. If number isn't given it's picked the way timeit's
+# autorange() does it, so each repeat takes at least minTime. A single call to something quick is mostly noise.
+# Like timeit, the garbage collector is switched off while timing, so it doesn't go off in some repeats and not others.
+def timeCalls(func, number=None, repeat=7, setup=None, minTime=0.2):
+    gcWasEnabled = gc.isenabled()
+    gc.disable()
+    try:
+        if number is None:
+            number = 1
+            while runCalls(func, number, setup) < minTime:
+                number *= 2
+        times = [runCalls(func, number, setup) / number for i in range(repeat)]
+    finally:
+        if gcWasEnabled:
+            gc.enable()
+    times.sort()
+    return {'min': times[0], 'median': times[len(times) // 2], 'number': number, 'repeat': repeat}
+
+
+# Calls setup, if there is one, then func number times, and returns how long the calls took.
+def runCalls(func, number, setup):
+    if setup is not None:
+        setup()
+    startTime = time.perf_counter()
+    for call in range(number):
+        func()
+    return time.perf_counter() - startTime
+
+
+# Sets up the settings, grid and player for a board, without starting the game loop.
+def makeBoard(settings, gridSize, numOfTreasures, seed=1):
+    settings.gridWidth = gridSize
+    settings.gridHeight = gridSize
+    settings.numOfTreasures = numOfTreasures
+    settings.rng = random.Random(seed)
+    settings.resetBoard()
+    settings.changeMode('play')
+    grid = clf.GameGrid(settings)
+    settings.populateTreasureList(grid)
+    hero = clf.Player(settings, settings.playerStart[0], settings.playerStart[1])
+    return grid, hero
+
+
+# The benchmarks that don't depend on the board size.
+def benchAssets(settings, results):
+    results['readTreasureText'] = timeCalls(lambda: settings.readTreasureText(settings.treasureFilename).close())
+    corpus = settings.readTreasureText(settings.treasureFilename)
+    results['buildTreasureIndex'] = timeCalls(corpus.buildIndex)
+    corpus.close()
+    screens = clf.getASCIIScreens()
+    results['createTextSprite.screens'] = timeCalls(lambda: [settings.createTextSprite(screen) for screen in screens.values()])
+
+    # Without the glyph cache, every line is rendered from scratch.
+    def renderUncached():
+        settings.glyphCache = clf.GlyphCache(0)
+        for screen in screens.values():
+            settings.createTextSprite(screen)
+    glyphCache = settings.glyphCache
+    results['createTextSprite.screens.uncached'] = timeCalls(renderUncached)
+    settings.glyphCache = glyphCache
+
+
+# The benchmarks that are run for each grid size, whatever is on it.
+def benchGrid(settings, gridSize, results):
+    label = '[grid=%dx%d]' % (gridSize, gridSize)
+    settings.gridWidth = settings.gridHeight = gridSize
+    results['GameGrid.__init__' + label] = timeCalls(lambda: clf.GameGrid(settings))
+
+
+# The benchmarks that are run for each grid size and number of treasures.
+def benchBoard(settings, gridSize, numOfTreasures, results):
+    label = '[grid=%dx%d,treasures=%d]' % (gridSize, gridSize, numOfTreasures)
+    grid, hero = makeBoard(settings, gridSize, numOfTreasures)
+
+    def populate():
+        settings.resetBoard()
+        settings.populateTreasureList(grid)
+    results['populateTreasureList' + label] = timeCalls(populate, repeat=5)
+    grid, hero = makeBoard(settings, gridSize, numOfTreasures)
+
+    def drawFull():
+        settings.fullRedraw = True
+        settings.drawScreen(hero, grid)
+        settings.dirtyRects = []
+    results['drawScreen.full' + label] = timeCalls(drawFull)
+
+    # Moving back and forth between two cells, so only they get redrawn.
+    home = (hero.x_coord, hero.y_coord)
+    step = [0]
+    def drawMove():
+        step[0] += 1
+        hero.x_coord = home[0] + (step[0] % 2 if home[0] < gridSize - 1 else -(step[0] % 2))
+        settings.drawScreen(hero, grid)
+        settings.dirtyRects = []
+    drawMove()
+    results['drawScreen.move' + label] = timeCalls(drawMove)
+    hero.x_coord, hero.y_coord = home
+
+    # The collision check in updatePlay, trying to move onto a cell that may or may not have something in it.
+    # The treasures bumped into are forgotten again each time, so every call does the same work.
+    rng = random.Random(2)
+    targets = [(rng.randrange(gridSize), rng.randrange(gridSize)) for i in range(1000)]
+    def collide():
+        for x, y in targets:
+            hero.x_coord = x - 1 if x > 0 else x + 1
+            hero.y_coord = y
+            hero.moveRight = x > 0
+            hero.moveLeft = x == 0
+            clf.updatePlay(settings, hero)
+            settings.gameMode = 'play'
+        for treasure in settings.examinedTreasures:
+            treasure.examined = False
+        settings.examinedTreasures = []
+    results['updatePlay.collision' + label] = timeCalls(collide)
+    hero.moveLeft = hero.moveRight = False
+    hero.x_coord, hero.y_coord = home
+
+    # One tick of the treasures wandering, with just feline and then a sample of everything wandering.
+    # The moved cells are thrown away instead of drawn, so this is only the cost of moving them.
+    def wander():
+        clf.wanderTreasures(settings, hero, grid)
+        settings.movedCells = []
+    settings.fullRedraw = False
+    for wanderMode in ('feline', 'sample'):
+        settings.wanderMode = wanderMode
+        results['wanderTreasures.' + wanderMode + label] = timeCalls(wander)
+    settings.wanderMode = 'off'
+
+
+def runBenchmarks(size):
+    settings = clf.GameSettings('play')
+    results = {}
+    benchAssets(settings, results)
+    for gridSize in gridSizes[size]:
+        benchGrid(settings, gridSize, results)
+        for numOfTreasures in treasureCounts[size]:
+            if numOfTreasures < gridSize * gridSize:
+                print('grid %dx%d, %d treasures' % (gridSize, gridSize, numOfTreasures), file=sys.stderr)
+                benchBoard(settings, gridSize, numOfTreasures, results)
+    pygame.quit()
+    return {'meta': {'python': platform.python_version(), 'pygame': pygame.version.ver,
+                     'platform': platform.platform(), 'time': time.strftime('%Y-%m-%d %H:%M:%S'),
+                     'size': size},
+            'results': results}
+
+
+# Prints how each result compares to the same one in the baseline. The fastest of the repeats is compared,
+# since it is the one least thrown off by whatever else the computer was doing at the time.
+# Returns the names of the ones that got slower by more than tolerance (0.25 is 25% slower).
+def compareResults(current, baseline, tolerance):
+    slower = []
+    for name in sorted(current['results']):
+        if name not in baseline['results']:
+            print('%-60s %10s' % (name, 'new'))
+            continue
+        now = current['results'][name]['min']
+        before = baseline['results'][name]['min']
+        ratio = now / before if before > 0 else float('inf')
+        flag = ''
+        if ratio > 1 + tolerance:
+            flag = '  SLOWER'
+            slower.append(name)
+        elif ratio < 1 / (1 + tolerance):
+            flag = '  faster'
+        print('%-60s %9.3fms %9.3fms %6.2fx%s' % (name, before * 1000, now * 1000, ratio, flag))
+    return slower
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Time the busiest parts of Cyborg Locates Feline.")
+    parser.add_argument('--quick', action='store_true', help="only run the smaller grids")
+    parser.add_argument('--output', metavar='FILE', help="write the results here instead of printing them")
+    parser.add_argument('--compare', metavar='FILE', help="compare the results with a saved set")
+    parser.add_argument('--tolerance', type=float, default=0.25,
+                        help="how much slower counts as a regression when comparing (default 0.25, which is 25%%)")
+    args = parser.parse_args()
+
+    results = runBenchmarks('quick' if args.quick else 'full')
+    if args.output is not None:
+        with open(args.output, 'w') as outputFile:
+            json.dump(results, outputFile, indent=2, sort_keys=True)
+    elif args.compare is None:
+        print(json.dumps(results, indent=2, sort_keys=True))
+
+    if args.compare is not None:
+        with open(args.compare) as baselineFile:
+            baseline = json.load(baselineFile)
+        slower = compareResults(results, baseline, args.tolerance)
+        if len(slower) > 0:
+            print('%d benchmarks got slower.' % len(slower))
+            sys.exit(1)
+
+if __name__ == '__main__':
+    main()
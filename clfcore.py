@@ -0,0 +1,1055 @@
+# Programmer: Eric Shumaker
+# File: clfcore.py
+# Language Version: Python 3.5.1
+# Depends On:   nothing outside the standard library
+#
+# The parts of Cyborg Locates Feline that don't need pygame,
+# so they can be shared by anything that wants them without opening a window.
+# That includes the game rules, so whole games can be simulated without a display.
+# Running this file plays lots of simulated games with a random bot and reports how fast they ran.
+
+import argparse, heapq, mmap, os, random, re, struct, sys, time
+from array import array
+from itertools import repeat
+from operator import add, itemgetter, mul, or_
+from collections import deque
+
+
+class TreasureCorpus():
+    """The treasure descriptions from the treasures.txt file, without reading the whole thing into memory.
+    The file is memory mapped, and an index of where each entry starts and ends (in bytes) is built
+    the first time and saved next to it as filename + '.idx'. The saved index is used again as long as
+    the size and modification time of the text file haven't changed. An index that was already
+    loaded from somewhere else (like the asset bundle) can be passed in as offsets instead.
+    Entries are separated by blank lines, and lines starting with '#' are comments."""
+
+    # The index file starts with this, so old or broken index files get rebuilt instead of used.
+    indexMagic = b'CLFIDX01'
+    indexHeader = struct.Struct('<8sQqQ')
+
+    def __init__(self, filename, fallbackText="This is not feline.", offsets=None):
+        self.filename = filename
+        self.indexFilename = filename + '.idx'
+        self.textFile = None
+        self.textMap = None
+        # offsets holds two numbers for each entry, the byte it starts at and the byte after it ends.
+        self.offsets = array('Q')
+        try:
+            self.textFile = open(filename, 'rb')
+            stats = os.fstat(self.textFile.fileno())
+            if stats.st_size > 0:
+                self.textMap = mmap.mmap(self.textFile.fileno(), 0, access=mmap.ACCESS_READ)
+                if offsets is not None:
+                    self.offsets = offsets
+                elif not self.loadIndex(stats):
+                    self.buildIndex()
+                    self.saveIndex(stats)
+        except FileNotFoundError:
+            pass
+        # In case treasures.txt is missing or empty, every treasure gets the same boring text.
+        self.fallbackEntry = [fallbackText]
+
+
+    def __len__(self):
+        return max(1, len(self.offsets) // 2)
+
+
+    # Returns the lines of one entry, as a list of strings.
+    def getEntry(self, index):
+        if len(self.offsets) == 0:
+            return list(self.fallbackEntry)
+        start = self.offsets[index * 2]
+        end = self.offsets[index * 2 + 1]
+        lines = self.textMap[start:end].decode('utf-8', 'replace').splitlines()
+        return [line.strip() for line in lines if line != '' and line[0] != '#']
+
+
+    # Returns count entry numbers picked at random. They are all different, unless there are
+    # more asked for than there are entries, in which case it goes through all of them before repeating.
+    # Nothing gets copied or deleted, so it takes the same time no matter how many entries there are.
+    def sample(self, count, rng=random):
+        picks = []
+        while count > 0:
+            batch = min(count, len(self))
+            picks.extend(rng.sample(range(len(self)), batch))
+            count -= batch
+        return picks
+
+
+    # Goes through the file a line at a time, noting where each entry starts and ends.
+    def buildIndex(self):
+        self.offsets = array('Q')
+        position = 0
+        start = None
+        end = 0
+        for line in iter(self.textMap.readline, b''):
+            if line[:1] == b'#':
+                # '#' is ignored as a comment, but doesn't end the entry.
+                pass
+            elif line.rstrip(b'\r\n') != b'':
+                # if the line is not blank, the entry now runs to the end of it.
+                if start is None:
+                    start = position
+                end = position + len(line)
+            elif start is not None:
+                # if the line is blank and an entry has begun, the entry is finished.
+                self.offsets.extend((start, end))
+                start = None
+            position += len(line)
+        # This makes sure the last entry is not ignored, even if it is not followed by a blank line.
+        if start is not None:
+            self.offsets.extend((start, end))
+        self.textMap.seek(0)
+
+
+    # Uses the saved index, if it was made from the same version of the text file.
+    # Returns False if it can't.
+    def loadIndex(self, stats):
+        try:
+            with open(self.indexFilename, 'rb') as indexFile:
+                header = indexFile.read(self.indexHeader.size)
+                if len(header) != self.indexHeader.size:
+                    return False
+                magic, size, mtime, count = self.indexHeader.unpack(header)
+                if magic != self.indexMagic or size != stats.st_size or mtime != stats.st_mtime_ns:
+                    return False
+                offsets = array('Q')
+                offsets.fromfile(indexFile, count * 2)
+        except (OSError, EOFError, struct.error):
+            return False
+        if sys.byteorder == 'big':
+            offsets.byteswap()
+        self.offsets = offsets
+        return True
+
+
+    # Saves the index so the next start doesn't have to build it again.
+    # If it can't be written, that's fine, it just gets built again next time.
+    def saveIndex(self, stats):
+        offsets = array('Q', self.offsets)
+        if sys.byteorder == 'big':
+            offsets.byteswap()
+        tempFilename = self.indexFilename + '.tmp'
+        try:
+            with open(tempFilename, 'wb') as indexFile:
+                indexFile.write(self.indexHeader.pack(self.indexMagic, stats.st_size, stats.st_mtime_ns, len(self.offsets) // 2))
+                offsets.tofile(indexFile)
+            os.replace(tempFilename, self.indexFilename)
+        except OSError:
+            pass
+
+
+    def close(self):
+        if self.textMap is not None:
+            self.textMap.close()
+            self.textMap = None
+        if self.textFile is not None:
+            self.textFile.close()
+            self.textFile = None
+
+
+
+# The modes the game can be in, in the order the pygame game lists them.
+gameModes = ['splash', 'message', 'instructions', 'play', 'win', 'credits']
+# The ways treasures can wander in the pygame game, by number for recordings.
+wanderModes = ['off', 'feline', 'sample']
+
+# What the player can do on each step of a simulated game. Holding a direction moves one cell per step.
+NOTHING, UP, DOWN, LEFT, RIGHT = range(5)
+# What can happen on a step. BUMPED means the player bumped into a treasure that isn't feline,
+# and FOUND means they bumped into feline and won.
+MOVED, STAYED, BUMPED, FOUND = range(4)
+# What a cell on a BoardBatch can hold.
+EMPTY, TREASURE, FELINE = range(3)
+# Which mode a board in a BoardBatch is in.
+PLAYING, READING, WON = range(3)
+
+
+# What pressing a key does in each of the modes that just wait for a key press.
+# The None entry is for any key that isn't listed. 'newgame' starts a new board and 'quit' ends the program.
+modeKeys = {
+    # Pressing 'i' switches to instructions mode, any other key starts game.
+    'splash': {'i': 'instructions', None: 'play'},
+    # Pressing any key will start the game.
+    'instructions': {None: 'play'},
+    # Pressing any key will continue the game.
+    'message': {None: 'play'},
+    # Pressing 'c' shows the credits, 'q' quits the program, any other key starts a new game.
+    'win': {'c': 'credits', 'q': 'quit', None: 'newgame'},
+    # Pressing any key takes you back to win mode.
+    'credits': {None: 'win'},
+}
+
+
+# Returns what pressing a key does in a mode. keyName is the key's name, like 'i', or None for any other key.
+def getModeAfterKey(mode, keyName):
+    keys = modeKeys[mode]
+    return keys.get(keyName, keys[None])
+
+
+# The characters treasures are drawn as. Each one looks like one of these, picked at random.
+# Every frontend draws them from here, so they all look alike.
+treasureSymbols = "`-=[]\\;,./~_+{}|:<>?!#$%^&*()1234567890zxcvbnmasdfghjklqwertyuiopZXCVBNMASDFGHJKLQWERTYUIOP"
+# How bright the red, green and blue of a treasure can each be. The pygame game's colors are every mix of them.
+treasureColorLevels = (102, 153, 204, 255)
+
+
+# This returns a dictionary with keys for the four screens described.
+# The keys hold a list of strings, one for each line that will need to
+# be rendered. The instructions tell you to use the arrow keys or the mouse, which is how the pygame game is played.
+# Games played some other way can give the lines saying how to move as moveInstructions instead.
+def getASCIIScreens(moveInstructions=None):
+    if moveInstructions is None:
+        moveInstructions = [
+            "To find out what something is, use the arrow keys",
+            "to move around until you bump into it.",
+            "With persistence, you will find feline in no time!",
+            "Or click somewhere to walk there,",
+            "or press 'A' to explore automatically."
+        ]
+    splash = [
+        r"  ___  _   _____   ___  ____   ___  ",
+        r" // \\ \\ //|| \\ // \\ || \\ // \\ ",
+        r" ||     \V/ ||_// || || ||_// ||___ ",
+        r" ||     //  || \\ || || ||\\  || || ",
+        r" \\_// //   ||_// \\_// || \\ \\_// ",
+        r"          _   _   _  ___ __  _      ",
+        r"      |  / \ /   /_\  |  |_ /_      ",
+        r"      |_ \_/ \_ /   \ |  |_ _/      ",
+        r" _____ _____ _     _  ___  _  _____ ",
+        r" ||    ||    ||    || ||\\ || ||    ",
+        r" ||__  ||__  ||    || || \\|| ||__  ",
+        r" ||    ||    ||    || ||  \|| ||    ",
+        r" ||    ||___ ||___ || ||   || ||___ ",
+        r"                                    ",
+        r"      'I' for instructions.         ",
+        r"     Any other key to start.        "
+    ]
+    instructions = [
+        "You are cyborg. You look like this - @",
+        "Your visual sensors are on the fritz.",
+        "You see things, by can't identify them.",
+        "What's worse, feline is missing!"
+    ] + moveInstructions + [
+        " ",
+        "Any key to start."
+    ]
+    win = [
+        " It is feline! You are reunited at last! ",
+        "                 __ __                   ",
+        "                /##V##\   |              ",
+        "           ^_^  \#####/   0              ",
+        "           0 0   \###/  >-#-<            ",
+        "          >\I/<   \#/    _^_             ",
+        "                   V    (0o0)            ",
+        "                                         ",
+        "              'Q' to quit.               ",
+        "            'C' for credits.             ",
+        "      Any other key to play again.       "
+    ]
+    credits = [
+        "Made by Eric Shumaker using",
+        "Python 3.5.1, Pygame 1.9.2, and the",
+        "LiberationMono-Bold.ttf font.",
+        " ",
+        "Inspired by 'robotfindskitten'",
+        "by Leonard Richardson (crummy.com)."
+    ]
+    return {'splash': splash, 'instructions': instructions, 'win': win, 'credits': credits}
+
+
+# Works out where the player ends up if they try to move, without going off the edge of the grid.
+# If more than one direction is held, right beats left beats up beats down, like it always has.
+# This is the rule the pygame game uses too.
+def getMoveDestination(x_coord, y_coord, moveUp, moveDown, moveLeft, moveRight, gridWidth, gridHeight):
+    destination = (x_coord, y_coord)
+    if moveDown and y_coord < gridHeight - 1:
+        destination = (x_coord, y_coord + 1)
+    if moveUp and y_coord > 0:
+        destination = (x_coord, y_coord - 1)
+    if moveLeft and x_coord > 0:
+        destination = (x_coord - 1, y_coord)
+    if moveRight and x_coord < gridWidth - 1:
+        destination = (x_coord + 1, y_coord)
+    return destination
+
+
+# The four cells next to a cell, that the player can move to.
+neighborSteps = ((0, -1), (0, 1), (-1, 0), (1, 0))
+
+
+# Follows the trail of parents back from the end cell, and returns the path from just after the start to the end.
+def tracePath(parents, end):
+    path = []
+    cell = end
+    while parents[cell] is not None:
+        path.append(cell)
+        cell = parents[cell]
+    path.reverse()
+    return path
+
+
+# Searches outwards from goal, going around anything in blocked, for up to maxSearch cells. Returns True if that's
+# everything that can be reached from goal, and start isn't in it, so there is no way from start to goal at all.
+# A* can only find that out by searching everywhere start can reach, which can be the whole grid, but a goal shut
+# in by treasures is found out here after looking at a few cells. If goal is blocked itself, the search starts
+# from the cells next to it, since a path can end by bumping into it.
+def isShutIn(start, goal, gridWidth, gridHeight, blocked, maxSearch=1000):
+    if goal in blocked:
+        frontier = deque()
+        seen = {goal}
+        for stepX, stepY in neighborSteps:
+            nextCell = (goal[0] + stepX, goal[1] + stepY)
+            if 0 <= nextCell[0] < gridWidth and 0 <= nextCell[1] < gridHeight and nextCell not in blocked:
+                frontier.append(nextCell)
+                seen.add(nextCell)
+    else:
+        frontier = deque([goal])
+        seen = {goal}
+    searched = 0
+    while len(frontier) > 0:
+        if searched >= maxSearch:
+            return False
+        cell = frontier.popleft()
+        if cell == start:
+            return False
+        searched += 1
+        x, y = cell
+        for stepX, stepY in neighborSteps:
+            nextX = x + stepX
+            nextY = y + stepY
+            if nextX < 0 or nextY < 0 or nextX >= gridWidth or nextY >= gridHeight:
+                continue
+            nextCell = (nextX, nextY)
+            if nextCell not in seen and nextCell not in blocked:
+                seen.add(nextCell)
+                frontier.append(nextCell)
+    return True
+
+
+
+class PathSearch():
+    """Finds the shortest path from start to goal with A*, going around anything in blocked
+    (which can be anything that works with 'in', like a set or the locationMap dictionary).
+    The goal itself can be blocked, in which case the path ends by bumping into it.
+    The search can be done a bit at a time: each call to run() looks at up to budget more cells, and returns
+    True once it's finished. Then path is the list of cells to move through, not counting start, or None if
+    there is no way there. Only the cells it needs to look at are stored, and it gives up after looking at
+    maxSearch of them, so it stays quick on huge grids. Before starting, isShutIn() checks whether goal
+    is somewhere start can't get to, so that doesn't take a search of everywhere start can get to."""
+    def __init__(self, start, goal, gridWidth, gridHeight, blocked, maxSearch=250000, shutInSearch=1000):
+        self.start = start
+        self.goal = goal
+        self.gridWidth = gridWidth
+        self.gridHeight = gridHeight
+        self.blocked = blocked
+        self.maxSearch = maxSearch
+        self.shutInSearch = shutInSearch
+        self.parents = {start: None}
+        self.costs = {start: 0}
+        # Each entry is (cost so far + distance left, distance left, cell). Ties go to the cell closer to the goal.
+        distance = abs(start[0] - goal[0]) + abs(start[1] - goal[1])
+        self.frontier = [(distance, distance, start)]
+        self.searched = 0
+        self.started = False
+        self.finished = start == goal
+        self.path = [] if self.finished else None
+
+
+    def run(self, budget):
+        if self.finished:
+            return True
+        if not self.started:
+            self.started = True
+            if isShutIn(self.start, self.goal, self.gridWidth, self.gridHeight, self.blocked, self.shutInSearch):
+                self.finished = True
+                return True
+        goal = self.goal
+        goalX, goalY = goal
+        gridWidth = self.gridWidth
+        gridHeight = self.gridHeight
+        blocked = self.blocked
+        parents = self.parents
+        costs = self.costs
+        frontier = self.frontier
+        stopAt = min(self.maxSearch, self.searched + budget)
+        searched = self.searched
+        while len(frontier) > 0 and searched < stopAt:
+            estimate, distance, cell = heapq.heappop(frontier)
+            if cell == goal:
+                self.path = tracePath(parents, goal)
+                self.finished = True
+                break
+            searched += 1
+            x, y = cell
+            cost = costs[cell] + 1
+            for stepX, stepY in neighborSteps:
+                nextX = x + stepX
+                nextY = y + stepY
+                if nextX < 0 or nextY < 0 or nextX >= gridWidth or nextY >= gridHeight:
+                    continue
+                nextCell = (nextX, nextY)
+                if nextCell != goal and nextCell in blocked:
+                    continue
+                if nextCell not in costs or cost < costs[nextCell]:
+                    costs[nextCell] = cost
+                    parents[nextCell] = cell
+                    distance = abs(nextX - goalX) + abs(nextY - goalY)
+                    heapq.heappush(frontier, (cost + distance, distance, nextCell))
+        self.searched = searched
+        if len(frontier) == 0 or searched >= self.maxSearch:
+            self.finished = True
+        return self.finished
+
+
+
+class NearestSearch():
+    """Searches outwards from start, going around anything in blocked, for the closest blocked cell that isTarget() likes.
+    Like a PathSearch it can be done a bit at a time, with run(budget). When it's finished, path is the path to
+    the cell it found, ending by bumping into it, or None if there isn't one within maxSearch cells."""
+    def __init__(self, start, gridWidth, gridHeight, blocked, isTarget, maxSearch=250000):
+        self.gridWidth = gridWidth
+        self.gridHeight = gridHeight
+        self.blocked = blocked
+        self.isTarget = isTarget
+        self.maxSearch = maxSearch
+        self.parents = {start: None}
+        self.frontier = deque([start])
+        self.searched = 0
+        self.finished = False
+        self.path = None
+
+
+    def run(self, budget):
+        if self.finished:
+            return True
+        gridWidth = self.gridWidth
+        gridHeight = self.gridHeight
+        blocked = self.blocked
+        isTarget = self.isTarget
+        parents = self.parents
+        frontier = self.frontier
+        stopAt = min(self.maxSearch, self.searched + budget)
+        searched = self.searched
+        while len(frontier) > 0 and searched < stopAt and not self.finished:
+            cell = frontier.popleft()
+            searched += 1
+            x, y = cell
+            for stepX, stepY in neighborSteps:
+                nextX = x + stepX
+                nextY = y + stepY
+                if nextX < 0 or nextY < 0 or nextX >= gridWidth or nextY >= gridHeight:
+                    continue
+                nextCell = (nextX, nextY)
+                if nextCell in parents:
+                    continue
+                parents[nextCell] = cell
+                if nextCell in blocked:
+                    if isTarget(nextCell):
+                        self.path = tracePath(parents, nextCell)
+                        self.finished = True
+                        break
+                else:
+                    frontier.append(nextCell)
+        self.searched = searched
+        if len(frontier) == 0 or searched >= self.maxSearch:
+            self.finished = True
+        return self.finished
+
+
+
+# The eight octants around the player, as multipliers that turn (across, out) in the first octant into x and y.
+fovOctants = ((1, 0, 0, 1), (0, 1, 1, 0), (0, -1, 1, 0), (-1, 0, 0, 1),
+              (-1, 0, 0, -1), (0, -1, -1, 0), (0, 1, -1, 0), (1, 0, 0, -1))
+
+
+# Works out which cells can be seen from (originX, originY), out to radius cells away, with recursive shadowcasting.
+# Anything in blocked (like the locationMap) blocks the view, though it can be seen itself, and so do the edges of the grid.
+# Each octant is scanned a row at a time, moving outwards. When a blocked cell is found the rest of the view past
+# it is scanned separately, with narrower slopes, so the shadow it casts is skipped over instead of checked cell by cell.
+# That way only cells that are within radius get looked at, however big the grid is.
+# The recursion is kept on a list instead of the call stack. Returns a set of (x, y) tuples.
+def computeFieldOfView(originX, originY, radius, gridWidth, gridHeight, blocked):
+    visible = {(originX, originY)}
+    radiusSquared = radius * radius
+    for xx, xy, yx, yy in fovOctants:
+        # Each entry is the row to start on, and the slopes of the two edges of the part of the view left to scan.
+        scans = [(1, 1.0, 0.0)]
+        while len(scans) > 0:
+            row, startSlope, endSlope = scans.pop()
+            if startSlope < endSlope:
+                continue
+            nextStart = startSlope
+            for distance in range(row, radius + 1):
+                inShadow = False
+                deltaY = -distance
+                for deltaX in range(-distance, 1):
+                    leftSlope = (deltaX - 0.5) / (deltaY + 0.5)
+                    rightSlope = (deltaX + 0.5) / (deltaY - 0.5)
+                    if startSlope < rightSlope:
+                        continue
+                    if endSlope > leftSlope:
+                        break
+                    x = originX + deltaX * xx + deltaY * xy
+                    y = originY + deltaX * yx + deltaY * yy
+                    inside = 0 <= x < gridWidth and 0 <= y < gridHeight
+                    if inside and deltaX * deltaX + deltaY * deltaY <= radiusSquared:
+                        visible.add((x, y))
+                    wall = not inside or (x, y) in blocked
+                    if inShadow:
+                        if wall:
+                            nextStart = rightSlope
+                            continue
+                        inShadow = False
+                        startSlope = nextStart
+                    elif wall and distance < radius:
+                        # The view past this cell gets scanned on its own, from the next row out.
+                        inShadow = True
+                        scans.append((distance + 1, startSlope, leftSlope))
+                        nextStart = rightSlope
+                if inShadow:
+                    break
+    return visible
+
+
+# Moves things around the board one cell at a time, for boards where the treasures wander.
+# movers is a list of the locations of the things that try to move this time. Each one picks a direction at random,
+# and moves if that cell is on the board, empty and not where the player is (avoid). occupied is the
+# occupancy of the board, like the locationMap dictionary, and is kept up to date as each thing moves,
+# so two things never end up in the same cell. Only the movers are looked at, so it takes the same time
+# however many things are on the board. Returns a list of (old location, new location) for the moves made.
+def wanderStep(movers, occupied, gridWidth, gridHeight, avoid, rng=random):
+    moves = []
+    getrandbits = rng.getrandbits
+    for location in movers:
+        stepX, stepY = neighborSteps[getrandbits(2)]
+        x = location[0] + stepX
+        y = location[1] + stepY
+        if x < 0 or y < 0 or x >= gridWidth or y >= gridHeight:
+            continue
+        destination = (x, y)
+        if destination == avoid or destination in occupied:
+            continue
+        occupied[destination] = occupied.pop(location)
+        moves.append((location, destination))
+    return moves
+
+
+# The fewest treasures a board can have, counting feline. One of the locations picked for them is where the
+# player starts instead, so with fewer than this there would be no feline to find.
+minTreasures = 2
+
+
+# Picks count different grid locations, as a list of (x, y) tuples.
+# The cells are numbered and count of the numbers are sampled without replacement, so there are
+# no retries, and it takes the same time however full the board gets, right up to every cell.
+def placeItems(gridWidth, gridHeight, count, rng=random):
+    if count > gridWidth * gridHeight:
+        raise ValueError("Can't place {} items on a {}x{} grid.".format(count, gridWidth, gridHeight))
+    return [(cell % gridWidth, cell // gridWidth) for cell in rng.sample(range(gridWidth * gridHeight), count)]
+
+
+
+class InputRecorder():
+    """Writes down everything the player does, so the session can be played back later by readInputLog().
+    Along with the seed and the board and wander settings, that is enough to get exactly the same games again.
+    The log is binary and small: each logic tick in play mode is the four move flags packed into one byte,
+    and runs of ticks with the same flags are stored once with a count. Key presses in the other modes
+    are one byte each. Numbers are stored 7 bits to a byte, so small ones take one byte."""
+    magic = b'CLFREC02'
+    header = struct.Struct('<8sqIIIBBdI')
+    # Logs from before the wander settings were noted down. They can still be read.
+    oldMagic = b'CLFREC01'
+    oldHeader = struct.Struct('<8sqIIIB')
+    # The kinds of record in the log. The bottom four bits of the record's first byte hold its contents.
+    TICKS = 0x10
+    KEY = 0x20
+    END = 0x30
+    # The key names that matter in some mode, by number. 0 is any other key.
+    keyNames = [None, 'i', 'c', 'q']
+
+    def __init__(self, filename, seed, gridWidth, gridHeight, numOfTreasures, startMode,
+                 wanderMode='off', wanderChance=0.25, wanderLimit=2000):
+        self.logFile = open(filename, 'wb')
+        self.logFile.write(self.header.pack(self.magic, seed, gridWidth, gridHeight, numOfTreasures,
+                                            gameModes.index(startMode), wanderModes.index(wanderMode),
+                                            wanderChance, wanderLimit))
+        self.runFlags = None
+        self.runLength = 0
+
+
+    # Notes down the move flags for one tick of the game logic.
+    def recordTick(self, moveUp, moveDown, moveLeft, moveRight):
+        flags = moveUp | moveDown << 1 | moveLeft << 2 | moveRight << 3
+        if flags != self.runFlags:
+            self.endRun()
+            self.runFlags = flags
+        self.runLength += 1
+
+
+    # Notes down a key pressed in one of the modes that wait for a key.
+    def recordKey(self, keyName):
+        self.endRun()
+        keyNumber = self.keyNames.index(keyName) if keyName in self.keyNames else 0
+        self.logFile.write(bytes([self.KEY | keyNumber]))
+
+
+    # Writes out the run of ticks so far, if there is one.
+    def endRun(self):
+        if self.runLength > 0:
+            self.logFile.write(bytes([self.TICKS | self.runFlags]) + packNumber(self.runLength))
+        self.runFlags = None
+        self.runLength = 0
+
+
+    def close(self):
+        if self.logFile is not None:
+            self.endRun()
+            self.logFile.write(bytes([self.END]))
+            self.logFile.close()
+            self.logFile = None
+
+
+
+# Packs a number that isn't negative into as few bytes as it fits in, 7 bits to a byte.
+def packNumber(number):
+    packed = bytearray()
+    while number >= 0x80:
+        packed.append(number & 0x7f | 0x80)
+        number >>= 7
+    packed.append(number)
+    return bytes(packed)
+
+
+# Reads a log written by an InputRecorder. Returns a dictionary of the settings the session started with,
+# and a list of what happened: ('ticks', (moveUp, moveDown, moveLeft, moveRight), count) for ticks in play mode,
+# and ('key', keyName) for key presses. Raises ValueError if the file isn't a log, or has been cut off part way
+# through a record.
+# Old logs don't have the wander settings, so 'wanderMode', 'wanderChance' and 'wanderLimit' are only there for new ones.
+def readInputLog(filename):
+    with open(filename, 'rb') as logFile:
+        data = logFile.read()
+    header = InputRecorder.header
+    if data[:len(InputRecorder.oldMagic)] == InputRecorder.oldMagic:
+        header = InputRecorder.oldHeader
+    if len(data) < header.size:
+        raise ValueError(filename + " is too short to be an input log.")
+    fields = header.unpack_from(data, 0)
+    magic, seed, gridWidth, gridHeight, numOfTreasures, startMode = fields[:6]
+    if magic not in (InputRecorder.magic, InputRecorder.oldMagic) or startMode >= len(gameModes):
+        raise ValueError(filename + " isn't an input log.")
+    settings = {'seed': seed, 'gridWidth': gridWidth, 'gridHeight': gridHeight,
+                'numOfTreasures': numOfTreasures, 'startMode': gameModes[startMode]}
+    if magic == InputRecorder.magic:
+        wanderMode, wanderChance, wanderLimit = fields[6:]
+        if wanderMode >= len(wanderModes):
+            raise ValueError(filename + " isn't an input log.")
+        settings.update({'wanderMode': wanderModes[wanderMode], 'wanderChance': wanderChance,
+                         'wanderLimit': wanderLimit})
+    if gridWidth < 1 or gridHeight < 1 or not minTreasures <= numOfTreasures <= gridWidth * gridHeight:
+        raise ValueError(filename + " has a board that can't be made.")
+    events = []
+    position = header.size
+    while position < len(data):
+        kind = data[position] & 0xf0
+        contents = data[position] & 0x0f
+        position += 1
+        if kind == InputRecorder.TICKS:
+            count = 0
+            shift = 0
+            while True:
+                if position >= len(data):
+                    raise ValueError(filename + " has been cut off.")
+                byte = data[position]
+                position += 1
+                count |= (byte & 0x7f) << shift
+                shift += 7
+                if byte < 0x80:
+                    break
+            flags = (bool(contents & 1), bool(contents & 2), bool(contents & 4), bool(contents & 8))
+            events.append(('ticks', flags, count))
+        elif kind == InputRecorder.KEY:
+            if contents >= len(InputRecorder.keyNames):
+                raise ValueError(filename + " isn't an input log.")
+            events.append(('key', InputRecorder.keyNames[contents]))
+        else:
+            break
+    return settings, events
+
+
+
+class GameSnapshot():
+    """A saved game: the board, where the player is and what mode the game is in, and the state of the random
+    numbers, so the boards after it come out the same too. writeSaveFile() and readSaveFile() write and read it.
+    The treasures are kept as packed arrays, one entry for each: x and y, a text number (an entry in the
+    TreasureCorpus, or -1 for feline), a color number, a symbol number and a byte of flags.
+    The text, color and symbol numbers stay the same for as long as the board is being played, so they're packed
+    into bytes once, by setTreasures(). Treasures that wander are moved in the x and y arrays with moveTreasure(),
+    which only copy straight out to bytes, so saving never has to go through the treasures one by one."""
+    magic = b'CLFSAVE\0'
+    version = 1
+    header = struct.Struct('<8sIqIIIIiiiBI')
+    # How many numbers there are in the state of a random.Random.
+    rngStateSize = 625
+    # The bits in each treasure's flags.
+    FELINE = 1
+    EXAMINED = 2
+
+    def __init__(self):
+        self.seed = 0
+        self.gridWidth = 0
+        self.gridHeight = 0
+        self.numOfTreasures = 0
+        self.playerX = 0
+        self.playerY = 0
+        self.mode = 'play'
+        # Which treasure, by its place in the arrays, the player is bumping into, or -1 for none.
+        self.collidingWith = -1
+        # How many entries the TreasureCorpus had, so a changed treasures.txt can be noticed.
+        self.textCount = 0
+        self.rngState = array('I', bytes(4 * self.rngStateSize))
+        self.setTreasures([])
+
+
+    # Fills in the treasure arrays from a list of (x, y, feline, textIndex, colorIndex, symbolIndex) tuples.
+    def setTreasures(self, items):
+        self.xs = array('I', [item[0] for item in items])
+        self.ys = array('I', [item[1] for item in items])
+        self.textIndices = array('i', [item[3] for item in items])
+        self.colorIndices = bytes([item[4] for item in items])
+        self.symbolIndices = bytes([item[5] for item in items])
+        self.flags = bytearray([self.FELINE if item[2] else 0 for item in items])
+        self.packedTexts = packArray(self.textIndices) + self.colorIndices + self.symbolIndices
+
+
+    # Keeps the snapshot up to date when the treasure numbered number moves to (x, y).
+    def moveTreasure(self, number, x, y):
+        self.xs[number] = x
+        self.ys[number] = y
+
+
+    # Returns the treasures as a list of (x, y, flags, textIndex, colorIndex, symbolIndex) tuples.
+    def getTreasures(self):
+        return list(zip(self.xs, self.ys, self.flags, self.textIndices, self.colorIndices, self.symbolIndices))
+
+
+    # Returns everything that goes in the save file, as a list of byte strings. flags can be
+    # given to save different flags from the ones in the snapshot, like when treasures have been examined since.
+    def pack(self, flags=None):
+        if flags is None:
+            flags = self.flags
+        header = self.header.pack(self.magic, self.version, self.seed, self.gridWidth, self.gridHeight,
+                                  self.numOfTreasures, len(self.xs), self.playerX, self.playerY, self.collidingWith,
+                                  gameModes.index(self.mode), self.textCount)
+        return [header, packArray(self.rngState), packArray(self.xs), packArray(self.ys), self.packedTexts, bytes(flags)]
+
+
+
+# Returns the numbers in an array as bytes, little endian whatever the computer is.
+def packArray(numbers):
+    if sys.byteorder == 'big':
+        numbers = array(numbers.typecode, numbers)
+        numbers.byteswap()
+    return numbers.tobytes()
+
+
+
+# Writes a save file from the list of byte strings GameSnapshot.pack() returns. It's written to a temporary
+# file first and then swapped in, so a save that gets interrupted never wrecks the last one.
+def writeSaveFile(filename, chunks):
+    tempFilename = filename + '.tmp'
+    with open(tempFilename, 'wb') as saveFile:
+        for chunk in chunks:
+            saveFile.write(chunk)
+    os.replace(tempFilename, filename)
+
+
+# Reads a save file written by writeSaveFile() and returns it as a GameSnapshot.
+# Raises ValueError if the file isn't a save file, is from a different version, or has been damaged
+# so that something in it doesn't make sense, like a mode that doesn't exist or a player off the board.
+def readSaveFile(filename):
+    with open(filename, 'rb') as saveFile:
+        data = saveFile.read()
+    header = GameSnapshot.header
+    if len(data) < header.size:
+        raise ValueError(filename + " is too short to be a save file.")
+    (magic, version, seed, gridWidth, gridHeight, numOfTreasures, count, playerX, playerY, collidingWith,
+     mode, textCount) = header.unpack_from(data, 0)
+    if magic != GameSnapshot.magic:
+        raise ValueError(filename + " isn't a save file.")
+    if version != GameSnapshot.version:
+        raise ValueError(filename + " was saved by a different version of the game.")
+    rngStart = header.size
+    treasureStart = rngStart + 4 * GameSnapshot.rngStateSize
+    if len(data) != treasureStart + 15 * count:
+        raise ValueError(filename + " is the wrong size for a save file.")
+    if mode >= len(gameModes):
+        raise ValueError(filename + " has a game mode that doesn't exist.")
+    if not -1 <= collidingWith < count or (gameModes[mode] == 'message' and collidingWith == -1):
+        raise ValueError(filename + " has the player bumping into a treasure that doesn't exist.")
+    if not (0 <= playerX < gridWidth and 0 <= playerY < gridHeight):
+        raise ValueError(filename + " has the player off the board.")
+    snapshot = GameSnapshot()
+    snapshot.seed = seed
+    snapshot.gridWidth = gridWidth
+    snapshot.gridHeight = gridHeight
+    snapshot.numOfTreasures = numOfTreasures
+    snapshot.playerX = playerX
+    snapshot.playerY = playerY
+    snapshot.collidingWith = collidingWith
+    snapshot.mode = gameModes[mode]
+    snapshot.textCount = textCount
+    arrays = []
+    position = rngStart
+    for typecode, length in (('I', GameSnapshot.rngStateSize), ('I', count), ('I', count), ('i', count)):
+        numbers = array(typecode)
+        numbers.frombytes(data[position:position + 4 * length])
+        if sys.byteorder == 'big':
+            numbers.byteswap()
+        arrays.append(numbers)
+        position += 4 * length
+    snapshot.rngState, snapshot.xs, snapshot.ys, snapshot.textIndices = arrays
+    # The last number is how far through the rest the random number generator has got.
+    if snapshot.rngState[-1] > GameSnapshot.rngStateSize - 1:
+        raise ValueError(filename + " has a broken random number state.")
+    if count > 0 and (max(snapshot.xs) >= gridWidth or max(snapshot.ys) >= gridHeight):
+        raise ValueError(filename + " has treasures off the board.")
+    cells = {y * gridWidth + x for x, y in zip(snapshot.xs, snapshot.ys)}
+    if len(cells) != count:
+        raise ValueError(filename + " has two treasures in the same place.")
+    if playerY * gridWidth + playerX in cells:
+        raise ValueError(filename + " has a treasure where the player is.")
+    if count > 0 and (min(snapshot.textIndices) < -1 or max(snapshot.textIndices) >= max(textCount, 1)):
+        raise ValueError(filename + " has treasures with text that doesn't exist.")
+    snapshot.colorIndices = data[position:position + count]
+    snapshot.symbolIndices = data[position + count:position + 2 * count]
+    if count > 0 and (max(snapshot.colorIndices) >= len(treasureColorLevels) ** 3
+                      or max(snapshot.symbolIndices) >= len(treasureSymbols)):
+        raise ValueError(filename + " has treasures with colors or symbols that don't exist.")
+    snapshot.flags = bytearray(data[position + 2 * count:position + 3 * count])
+    snapshot.packedTexts = data[position - 4 * count:position + 2 * count]
+    return snapshot
+
+
+
+class TickScheduler():
+    """Keeps the game logic running at tickRate ticks per second, however fast or slow frames are drawn.
+    Each frame, getTicksDue() says how many ticks to run to catch up with the clock. If the game falls
+    a long way behind, it only catches up maxCatchUp ticks at a time and forgets the rest,
+    so one slow frame doesn't turn into a burst of moves."""
+    def __init__(self, tickRate, maxCatchUp=5, clock=time.perf_counter):
+        self.tickLength = 1.0 / tickRate
+        self.maxCatchUp = maxCatchUp
+        self.clock = clock
+        self.reset()
+
+
+    # Starts counting from now, forgetting any time that went by before.
+    def reset(self):
+        self.lastTime = None
+        self.owed = 0.0
+
+
+    # Returns how many ticks should run now.
+    def getTicksDue(self):
+        now = self.clock()
+        if self.lastTime is None:
+            # The first tick happens straight away, so a key pressed on the first frame isn't held up.
+            self.lastTime = now
+            self.owed = self.tickLength
+        self.owed += now - self.lastTime
+        self.lastTime = now
+        ticks = int(self.owed / self.tickLength)
+        if ticks > self.maxCatchUp:
+            self.owed = 0.0
+            return self.maxCatchUp
+        self.owed -= ticks * self.tickLength
+        return ticks
+
+
+
+class Board():
+    """One game, following the same rules as the pygame version, but with no window, fonts or pictures.
+    Call step() with one of the actions to play it. items maps (x, y) to True for feline
+    and False for any other treasure. Like the pygame game, numOfTreasures - 1 items are placed."""
+    def __init__(self, gridWidth=40, gridHeight=40, numOfTreasures=20, rng=random):
+        self.gridWidth = gridWidth
+        self.gridHeight = gridHeight
+        self.numOfTreasures = numOfTreasures
+        self.rng = rng
+        self.reset()
+
+
+    # Sets up a new board.
+    def reset(self):
+        locations = placeItems(self.gridWidth, self.gridHeight, self.numOfTreasures, self.rng)
+        # The first item placed is feline, and the last location is where the player starts.
+        self.items = dict.fromkeys(locations[:-1], False)
+        self.items[locations[0]] = True
+        self.x_coord, self.y_coord = locations[-1]
+        self.mode = 'play'
+        self.collidingWith = None
+        self.steps = 0
+
+
+    # Plays one step of the game and returns what happened.
+    # Bumping into a treasure shows its message, and the next step just goes back to playing.
+    def step(self, action):
+        self.steps += 1
+        if self.mode == 'win':
+            return FOUND
+        if self.mode == 'message':
+            self.mode = 'play'
+            return STAYED
+        destination = getMoveDestination(self.x_coord, self.y_coord, action == UP, action == DOWN,
+                                         action == LEFT, action == RIGHT, self.gridWidth, self.gridHeight)
+        if destination in self.items:
+            self.collidingWith = destination
+            if self.items[destination]:
+                self.mode = 'win'
+                return FOUND
+            self.mode = 'message'
+            return BUMPED
+        self.collidingWith = None
+        if destination == (self.x_coord, self.y_coord):
+            return STAYED
+        self.x_coord, self.y_coord = destination
+        return MOVED
+
+
+
+class BoardBatch():
+    """Lots of independent games stepped together, for running bots over many boards quickly.
+    The boards are stored as flat arrays instead of objects: cells holds EMPTY, TREASURE or FELINE for
+    every cell of every board, one board after another, and positions and modes hold one entry per board.
+    A position is the number of the player's cell on its own board, y * gridWidth + x.
+    Each step works out every board's destination at once, from moveTable, and only goes through the boards
+    one at a time where something other than a plain move happened, which isn't many of them.
+    When a board is won it is counted and replaced with a new one straight away, so the batch never runs out."""
+    def __init__(self, count, gridWidth=40, gridHeight=40, numOfTreasures=20, rng=random):
+        self.count = count
+        self.gridWidth = gridWidth
+        self.gridHeight = gridHeight
+        self.numOfTreasures = numOfTreasures
+        self.rng = rng
+        self.boardSize = gridWidth * gridHeight
+        self.cells = bytearray(count * self.boardSize)
+        # Where each board starts in cells.
+        self.boardStarts = range(0, count * self.boardSize, self.boardSize)
+        self.positions = [0] * count
+        self.modes = bytearray(count)
+        self.moveTable = self.makeMoveTable()
+        self.steps = 0
+        self.bumps = 0
+        self.wins = 0
+        for board in range(count):
+            self.resetBoard(board)
+
+
+    # Returns where the player ends up for each action from each cell, with getMoveDestination(),
+    # as a list with an entry for position * 5 + action. It's the same for every board, so it's only made once.
+    def makeMoveTable(self):
+        width = self.gridWidth
+        moveTable = []
+        for position in range(self.boardSize):
+            x = position % width
+            y = position // width
+            for action in (NOTHING, UP, DOWN, LEFT, RIGHT):
+                destination = getMoveDestination(x, y, action == UP, action == DOWN, action == LEFT, action == RIGHT,
+                                                 width, self.gridHeight)
+                moveTable.append(destination[1] * width + destination[0])
+        return moveTable
+
+
+    # Returns where the player is on a board, as (x, y).
+    def getPlayer(self, board):
+        return self.positions[board] % self.gridWidth, self.positions[board] // self.gridWidth
+
+
+    # Clears one board and places new treasures and a new player on it.
+    def resetBoard(self, board):
+        start = board * self.boardSize
+        self.cells[start:start + self.boardSize] = bytes(self.boardSize)
+        locations = placeItems(self.gridWidth, self.gridHeight, self.numOfTreasures, self.rng)
+        for x, y in locations[1:-1]:
+            self.cells[start + y * self.gridWidth + x] = TREASURE
+        x, y = locations[0]
+        self.cells[start + y * self.gridWidth + x] = FELINE
+        x, y = locations[-1]
+        self.positions[board] = y * self.gridWidth + x
+        self.modes[board] = PLAYING
+
+
+    # Steps every board once. actions has one action for each board.
+    # Every board is moved to its destination, and the few that were reading a message or bumped into something
+    # are put back and sorted out afterwards. The player's own cell is always empty, so a move that doesn't
+    # go anywhere needs nothing doing. Returns how many boards were won on this step.
+    def step(self, actions):
+        cells = self.cells
+        modes = self.modes
+        oldPositions = self.positions
+        positions = list(getItems(self.moveTable, map(add, map(mul, oldPositions, repeat(5)), actions)))
+        contents = bytes(getItems(cells, map(add, self.boardStarts, positions)))
+        # Non-zero for the boards that didn't just move, since EMPTY and PLAYING are both 0.
+        unusual = bytes(map(or_, contents, modes))
+        self.positions = positions
+        wins = 0
+        for match in nonZeroByte.finditer(unusual):
+            board = match.start()
+            positions[board] = oldPositions[board]
+            if modes[board] == READING:
+                modes[board] = PLAYING
+            elif contents[board] == TREASURE:
+                modes[board] = READING
+                self.bumps += 1
+            else:
+                wins += 1
+                self.resetBoard(board)
+        self.steps += self.count
+        self.wins += wins
+        return wins
+
+
+
+# Finds the bytes that aren't 0, for BoardBatch.step().
+nonZeroByte = re.compile(b'[^\\x00]')
+
+
+# Returns the items in sequence at each of the places in indices, as a tuple. It's like a list comprehension
+# of sequence[index], but done by operator.itemgetter without going through python code for each one.
+# The items can't be tuples themselves, since itemgetter gives back a lone item instead of a tuple of one.
+def getItems(sequence, indices):
+    items = itemgetter(*indices)(sequence)
+    return items if isinstance(items, tuple) else (items,)
+
+
+# Runs a batch of boards with a bot that moves in a random direction every step,
+# and reports how fast it went.
+def runBatch(count, numSteps, gridWidth=40, gridHeight=40, numOfTreasures=20, seed=None):
+    rng = random.Random(seed)
+    batch = BoardBatch(count, gridWidth, gridHeight, numOfTreasures, rng)
+    startTime = time.perf_counter()
+    for i in range(numSteps):
+        batch.step([rng.randrange(1, 5) for board in range(count)])
+    seconds = time.perf_counter() - startTime
+    return {'boards': count, 'steps': batch.steps, 'wins': batch.wins, 'bumps': batch.bumps,
+            'seconds': seconds, 'stepsPerSecond': batch.steps / seconds if seconds > 0 else 0.0}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run lots of Cyborg Locates Feline games without a window.")
+    parser.add_argument('--boards', type=int, default=1000, help="how many boards to run at once")
+    parser.add_argument('--steps', type=int, default=1000, help="how many steps to run each board for")
+    parser.add_argument('--width', type=int, default=40, help="grid width")
+    parser.add_argument('--height', type=int, default=40, help="grid height")
+    parser.add_argument('--treasures', type=int, default=20, help="treasures on each board")
+    parser.add_argument('--seed', type=int, default=None, help="seed for the random numbers")
+    args = parser.parse_args()
+    if args.treasures < minTreasures:
+        parser.error("--treasures has to be at least %d, counting feline" % minTreasures)
+    results = runBatch(args.boards, args.steps, args.width, args.height, args.treasures, args.seed)
+    print("{boards} boards, {steps} steps in {seconds:.2f} seconds, {stepsPerSecond:.0f} steps per second, "
+          "{wins} wins, {bumps} bumps".format(**results))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,98 @@
+#! /usr/bin/python3
+
+# Programmer: Eric Shumaker
+# File: clfload.py
+# Language Version: Python 3.5.1
+# Depends On:   clfserver.py
+#
+# Connects lots of players to clfserver.py at once. Each one sends a random move, waits for the screen
+# to come back, and does it again, for as long as it's told to. At the end it reports how many lines
+# a second the server answered and how long the answers took.
+
+import argparse, asyncio, json, random, sys, time
+from clfserver import prompt, defaultPort
+
+
+# One player. Sends moves until stopTime and adds how long each answer took, in seconds, to latencies.
+async def runPlayer(args, rng, stopTime, latencies, errors):
+    try:
+        if args.unix is not None:
+            reader, writer = await asyncio.open_unix_connection(args.unix)
+        else:
+            reader, writer = await asyncio.open_connection(args.host, args.port)
+        await reader.readuntil(prompt)
+    except (OSError, asyncio.IncompleteReadError):
+        errors[0] += 1
+        return
+    try:
+        while time.perf_counter() < stopTime:
+            # Moves work in play mode, and in the other modes they just carry on to the next screen.
+            # None of them is 'q', so the players never quit from the win screen.
+            line = ''.join(rng.choice('wasd') for i in range(args.moves)) + '\n'
+            startTime = time.perf_counter()
+            writer.write(line.encode('ascii'))
+            await writer.drain()
+            await reader.readuntil(prompt)
+            latencies.append(time.perf_counter() - startTime)
+            if args.think > 0:
+                await asyncio.sleep(rng.uniform(0, 2 * args.think))
+        writer.write(b'quit\n')
+        await writer.drain()
+    except (OSError, asyncio.IncompleteReadError, asyncio.LimitOverrunError):
+        errors[0] += 1
+    finally:
+        writer.close()
+
+
+def getPercentile(sortedTimes, percent):
+    if len(sortedTimes) == 0:
+        return 0.0
+    return sortedTimes[min(len(sortedTimes) - 1, int(len(sortedTimes) * percent / 100))]
+
+
+async def runLoad(args):
+    rng = random.Random(args.seed)
+    latencies = []
+    errors = [0]
+    startTime = time.perf_counter()
+    stopTime = startTime + args.seconds
+    # Each player gets its own random numbers, so the moves don't depend on what order they run in.
+    players = [runPlayer(args, random.Random(rng.getrandbits(64)), stopTime, latencies, errors) for i in range(args.clients)]
+    await asyncio.gather(*players)
+    seconds = time.perf_counter() - startTime
+    latencies.sort()
+    return {'clients': args.clients, 'seconds': seconds, 'lines': len(latencies), 'errors': errors[0],
+            'linesPerSecond': len(latencies) / seconds if seconds > 0 else 0.0,
+            'latencyMs': {'p50': getPercentile(latencies, 50) * 1000, 'p95': getPercentile(latencies, 95) * 1000,
+                          'p99': getPercentile(latencies, 99) * 1000, 'max': getPercentile(latencies, 100) * 1000}}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure how quickly clfserver.py keeps up with lots of players.")
+    parser.add_argument('--host', default='127.0.0.1', help="address the server is on (default 127.0.0.1)")
+    parser.add_argument('--port', type=int, default=defaultPort, help="port the server is on (default %d)" % defaultPort)
+    parser.add_argument('--unix', metavar='PATH', help="connect to a Unix socket here instead of TCP")
+    parser.add_argument('--clients', type=int, default=100, help="how many players to connect (default 100)")
+    parser.add_argument('--seconds', type=float, default=10.0, help="how long to keep sending moves (default 10)")
+    parser.add_argument('--moves', type=int, default=1, help="how many moves to send on each line (default 1)")
+    parser.add_argument('--think', type=float, default=0.0, metavar='SECONDS',
+                        help="average time each player waits between lines (default 0, as fast as possible)")
+    parser.add_argument('--seed', type=int, default=None, help="seed for the random numbers")
+    parser.add_argument('--json', action='store_true', help="print the results as JSON")
+    args = parser.parse_args()
+
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    results = loop.run_until_complete(runLoad(args))
+    loop.close()
+    if args.json:
+        print(json.dumps(results, indent=2, sort_keys=True))
+    else:
+        print("{clients} players, {lines} lines in {seconds:.2f} seconds, {linesPerSecond:.0f} lines per second, "
+              "{errors} errors".format(**results))
+        print("Latency: 50% {p50:.2f}ms, 95% {p95:.2f}ms, 99% {p99:.2f}ms, max {max:.2f}ms".format(**results['latencyMs']))
+    if results['errors'] > 0:
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
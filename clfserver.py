@@ -0,0 +1,192 @@
+#! /usr/bin/python3
+
+# Programmer: Eric Shumaker
+# File: clfserver.py
+# Language Version: Python 3.5.1
+# Depends On:   clfcore.py,
+#               clftext.py
+#
+# Hosts lots of games of Cyborg Locates Feline at once, from one process, over a TCP or Unix socket.
+# There's no window and no pygame. The game is the text version from clftext.py, with the screens drawn
+# as text with ANSI colors, so 'telnet localhost 7117' or 'nc localhost 7117' is enough to play.
+#
+# The protocol is one line at a time. Each character on a line is a key press: w, a, s and d move in play mode,
+# and the other modes take the same keys as the pygame game ('i' for instructions, 'c' for credits, 'q' to quit,
+# anything else to carry on). An empty line counts as 'any other key'. 'quit' on its own line disconnects.
+# After every line the server sends back the whole screen, ending with the prompt.
+# clfload.py connects lots of players at once and measures how quickly the server answers.
+
+import argparse, asyncio, os, sys, textwrap, time
+from clfcore import minTreasures
+from clftext import TextGame, playerColor, plainColor
+
+
+# Every screen the server sends ends with this, so a client knows when it has the whole thing.
+# The escape code in it can't turn up in treasures.txt, so it can't be confused with a treasure's text.
+prompt = b'\x1b[0m> '
+defaultPort = 7117
+clearScreen = '\x1b[H\x1b[2J'
+# How to move, for the instructions screen. There's no mouse or auto-explore here, and 'a' moves left.
+moveInstructions = [
+    "To find out what something is, type w, a, s or d",
+    "and press Enter to move around until you bump into it.",
+    "With persistence, you will find feline in no time!"
+]
+
+
+
+class GameServer():
+    """Runs the sessions, which are clftext TextSessions played by one TextGame. Moves only happen when
+    a player sends a line, so a session that isn't doing anything costs nothing but the memory it takes up,
+    and thousands of them can share one core."""
+    def __init__(self, gridWidth=40, gridHeight=40, numOfTreasures=20, seed=None, treasureFilename='treasures.txt'):
+        self.game = TextGame(gridWidth, gridHeight, numOfTreasures, seed, treasureFilename, moveInstructions)
+        # How much of the board is shown around the player, in cells.
+        self.viewWidth = min(gridWidth, 60)
+        self.viewHeight = min(gridHeight, 18)
+        self.sessionCount = 0
+        self.sessionsStarted = 0
+        self.linesHandled = 0
+
+
+    def newSession(self):
+        self.sessionCount += 1
+        self.sessionsStarted += 1
+        return self.game.newSession()
+
+
+    def endSession(self, session):
+        self.sessionCount -= 1
+
+
+    # Handles one line from the player. Returns False if they want to leave.
+    def handleLine(self, session, line):
+        self.linesHandled += 1
+        if line == 'quit':
+            return False
+        if session.mode != 'play':
+            return self.game.pressKey(session, line[:1].lower() or None)
+        # In play mode, every character is a key press, until one of them changes the mode.
+        for key in line.lower():
+            self.game.pressKey(session, key)
+            if session.mode != 'play':
+                break
+        return True
+
+
+    # Returns the part of the board around the player, as a list of lines with ANSI colors.
+    def drawBoard(self, session):
+        board = session.board
+        width = self.viewWidth
+        height = self.viewHeight
+        viewX = max(0, min(board.x_coord - width // 2, board.gridWidth - width))
+        viewY = max(0, min(board.y_coord - height // 2, board.gridHeight - height))
+        rows = [[' '] * width for y in range(height)]
+        for x, y, symbol, color in self.game.getTreasuresInView(session, viewX, viewY, width, height):
+            rows[y - viewY][x - viewX] = color + symbol + plainColor
+        rows[board.y_coord - viewY][board.x_coord - viewX] = playerColor + '@' + plainColor
+        border = '+' + '-' * width + '+'
+        return [border] + ['|' + ''.join(row) + '|' for row in rows] + [border]
+
+
+    # Returns everything that gets sent to the player after each line, prompt included.
+    def drawSession(self, session):
+        mode = session.mode
+        if mode == 'play':
+            lines = self.drawBoard(session)
+            lines.append('(%d, %d)  w/a/s/d and Enter to move, quit to leave.' % (session.board.x_coord, session.board.y_coord))
+        elif mode == 'message':
+            lines = self.drawBoard(session)
+            x_coord, y_coord = session.board.collidingWith
+            for line in self.game.getTreasureText(session, x_coord, y_coord):
+                lines.extend(textwrap.wrap(line, self.viewWidth + 2) or [''])
+            lines.append('Any key to continue.')
+        else:
+            lines = list(self.game.screens[mode])
+        return (clearScreen + '\r\n'.join(lines) + '\r\n').encode('utf-8') + prompt
+
+
+    # Runs one player's connection, from the first screen until they leave or hang up.
+    async def handleClient(self, reader, writer):
+        session = self.newSession()
+        try:
+            writer.write(self.drawSession(session))
+            await writer.drain()
+            while True:
+                line = await reader.readline()
+                if line == b'':
+                    break
+                if not self.handleLine(session, line.decode('utf-8', 'replace').strip()):
+                    break
+                writer.write(self.drawSession(session))
+                await writer.drain()
+        except (ConnectionError, ValueError, asyncio.LimitOverrunError):
+            # A line too long for the reader's buffer makes readline() raise ValueError. Nobody typing
+            # moves sends one, so the client is just dropped.
+            pass
+        finally:
+            self.endSession(session)
+            writer.close()
+
+
+    # Prints how many sessions there are and how many lines a second are being handled, every interval seconds.
+    async def reportStats(self, interval):
+        lastLines = self.linesHandled
+        lastTime = time.perf_counter()
+        while True:
+            await asyncio.sleep(interval)
+            now = time.perf_counter()
+            print('%d sessions open, %d started, %.0f lines per second' %
+                  (self.sessionCount, self.sessionsStarted, (self.linesHandled - lastLines) / (now - lastTime)),
+                  file=sys.stderr)
+            lastLines = self.linesHandled
+            lastTime = now
+
+
+    def close(self):
+        self.game.close()
+
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Host lots of games of Cyborg Locates Feline over a socket.")
+    parser.add_argument('--host', default='127.0.0.1', help="address to listen on (default 127.0.0.1)")
+    parser.add_argument('--port', type=int, default=defaultPort, help="port to listen on (default %d)" % defaultPort)
+    parser.add_argument('--unix', metavar='PATH', help="listen on a Unix socket here instead of TCP")
+    parser.add_argument('--width', type=int, default=40, help="grid width")
+    parser.add_argument('--height', type=int, default=40, help="grid height")
+    parser.add_argument('--treasures', type=int, default=20, help="treasures on each board")
+    parser.add_argument('--seed', type=int, default=None, help="seed for the random numbers")
+    parser.add_argument('--stats', type=float, default=10.0, metavar='SECONDS',
+                        help="how often to print the number of sessions, 0 to never (default 10)")
+    args = parser.parse_args()
+    if args.treasures < minTreasures:
+        parser.error("--treasures has to be at least %d, counting feline" % minTreasures)
+
+    # treasures.txt is looked for next to this file.
+    os.chdir(os.path.dirname(os.path.abspath(__file__)))
+    server = GameServer(args.width, args.height, args.treasures, args.seed)
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    # The backlog is big so a crowd of players connecting at once doesn't get turned away.
+    if args.unix is not None:
+        listener = loop.run_until_complete(asyncio.start_unix_server(server.handleClient, args.unix, backlog=4096))
+        print('Listening on ' + args.unix, file=sys.stderr)
+    else:
+        listener = loop.run_until_complete(asyncio.start_server(server.handleClient, args.host, args.port, backlog=4096))
+        print('Listening on %s port %d' % (args.host, args.port), file=sys.stderr)
+    if args.stats > 0:
+        loop.create_task(server.reportStats(args.stats))
+    try:
+        loop.run_forever()
+    except KeyboardInterrupt:
+        pass
+    listener.close()
+    loop.run_until_complete(listener.wait_closed())
+    loop.close()
+    server.close()
+    if args.unix is not None:
+        os.remove(args.unix)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,288 @@
+#! /usr/bin/python3
+
+# Programmer: Eric Shumaker
+# File: clfterm.py
+# Language Version: Python 3.5.1
+# Depends On:   clfcore.py,
+#               clftext.py
+#
+# Plays Cyborg Locates Feline in a terminal, without pygame, fonts or a window, so it works over SSH.
+# The game is the text version from clftext.py, the same one clfserver.py hosts, so it doesn't have the
+# pygame game's autopilot, fog, wandering, saving or replays (clftext.py says why). The drawing goes through
+# a TextScreen, which remembers what the terminal is showing and only sends the characters that changed.
+# Arrow keys or w, a, s and d move, and the other keys are the same as in the pygame game.
+
+import argparse, os, select, shutil, signal, sys, termios, textwrap, tty
+from clfcore import minTreasures
+from clftext import TextGame, playerColor, plainColor
+
+
+# Escape codes for the terminal. The alternate screen keeps the game from scribbling over the shell's scrollback.
+enterScreen = '\x1b[?1049h\x1b[?25l\x1b[H\x1b[2J'
+leaveScreen = '\x1b[0m\x1b[?25h\x1b[?1049l'
+borderColor = '\x1b[0;37m'
+# What the arrow keys send, after '\x1b[' or '\x1bO'. They do the same as w, a, s and d.
+arrowKeys = {'A': 'w', 'B': 's', 'C': 'd', 'D': 'a'}
+# How to move, for the instructions screen. Unlike on the server, keys work as soon as they're pressed.
+moveInstructions = [
+    "To find out what something is, use the arrow keys",
+    "or w, a, s and d to move around until you bump into it.",
+    "With persistence, you will find feline in no time!"
+]
+
+
+
+class TextScreen():
+    """A grid of characters, each with an ANSI color code, that stands in for the window.
+    Drawing only changes the grid. getUpdate() then compares it with what was sent last time and
+    returns just what is needed to change the terminal to match: a cursor move wherever the changed
+    characters aren't next to each other, a color code wherever the color changes, and the characters.
+    Whole rows that haven't changed are skipped without looking at each character."""
+    def __init__(self, width, height):
+        self.resize(width, height)
+
+
+    # Starts again with a new size. The next update redraws everything.
+    def resize(self, width, height):
+        self.width = width
+        self.height = height
+        self.chars = [' '] * (width * height)
+        self.colors = [plainColor] * (width * height)
+        self.invalidate()
+
+
+    # Forgets what the terminal is showing, so the next update sends every character.
+    def invalidate(self):
+        self.shownChars = [None] * (self.width * self.height)
+        self.shownColors = [None] * (self.width * self.height)
+        self.shownColor = None
+        self.needsClear = True
+
+
+    def clear(self):
+        self.chars = [' '] * (self.width * self.height)
+        self.colors = [plainColor] * (self.width * self.height)
+
+
+    # Puts a character at a location. Anything off the screen is ignored.
+    def putChar(self, x, y, char, color=plainColor):
+        if 0 <= x < self.width and 0 <= y < self.height:
+            self.chars[y * self.width + x] = char
+            self.colors[y * self.width + x] = color
+
+
+    # Puts a line of text starting at a location, cutting off whatever doesn't fit.
+    def putText(self, x, y, text, color=plainColor):
+        for char in text:
+            self.putChar(x, y, char, color)
+            x += 1
+
+
+    # Puts lines of text in the middle of the screen, like blitMessage does in the window.
+    def putCenteredLines(self, lines, color=plainColor):
+        top = (self.height - len(lines)) // 2
+        for row, line in enumerate(lines):
+            self.putText((self.width - len(line)) // 2, top + row, line, color)
+
+
+    # Returns the text to write to the terminal to bring it up to date.
+    def getUpdate(self):
+        width = self.width
+        chars = self.chars
+        colors = self.colors
+        shownChars = self.shownChars
+        shownColors = self.shownColors
+        output = []
+        if self.needsClear:
+            output.append(plainColor + '\x1b[H\x1b[2J')
+            self.shownColor = plainColor
+            self.needsClear = False
+        color = self.shownColor
+        for y in range(self.height):
+            start = y * width
+            end = start + width
+            if chars[start:end] == shownChars[start:end] and colors[start:end] == shownColors[start:end]:
+                continue
+            cursor = None
+            for i in range(start, end):
+                if chars[i] == shownChars[i] and colors[i] == shownColors[i]:
+                    continue
+                if cursor != i:
+                    output.append('\x1b[%d;%dH' % (y + 1, i - start + 1))
+                if colors[i] != color:
+                    color = colors[i]
+                    output.append(color)
+                output.append(chars[i])
+                shownChars[i] = chars[i]
+                shownColors[i] = colors[i]
+                cursor = i + 1
+        self.shownColor = color
+        return ''.join(output)
+
+
+
+class TerminalGame():
+    """One game played at the terminal. The rules and modes come from a TextGame with a single session,
+    so it plays exactly like a game on the server. Nothing is drawn until a key is pressed or the terminal
+    changes size, so it uses no processor time while waiting."""
+    def __init__(self, gridWidth=40, gridHeight=40, numOfTreasures=20, seed=None):
+        self.game = TextGame(gridWidth, gridHeight, numOfTreasures, seed, moveInstructions=moveInstructions)
+        self.session = self.game.newSession()
+        columns, rows = shutil.get_terminal_size()
+        self.screen = TextScreen(columns, rows)
+        self.viewX = 0
+        self.viewY = 0
+        self.resized = False
+        self.running = True
+
+
+    def onResize(self, signalNumber, frame):
+        self.resized = True
+
+
+    # How many cells of the board fit on screen, leaving room for the border and the status line.
+    def getViewSize(self):
+        board = self.session.board
+        return (max(1, min(board.gridWidth, self.screen.width - 2)), max(1, min(board.gridHeight, self.screen.height - 3)))
+
+
+    # Scrolls the view when the player gets within a quarter screen of its edge, like GameGrid.followPlayer.
+    def followPlayer(self):
+        board = self.session.board
+        viewWidth, viewHeight = self.getViewSize()
+        marginX = viewWidth // 4
+        marginY = viewHeight // 4
+        if not (self.viewX + marginX <= board.x_coord < self.viewX + viewWidth - marginX):
+            self.viewX = board.x_coord - viewWidth // 2
+        if not (self.viewY + marginY <= board.y_coord < self.viewY + viewHeight - marginY):
+            self.viewY = board.y_coord - viewHeight // 2
+        self.viewX = max(0, min(self.viewX, board.gridWidth - viewWidth))
+        self.viewY = max(0, min(self.viewY, board.gridHeight - viewHeight))
+
+
+    def drawBoard(self):
+        screen = self.screen
+        session = self.session
+        board = session.board
+        self.followPlayer()
+        viewWidth, viewHeight = self.getViewSize()
+        viewX = self.viewX
+        viewY = self.viewY
+        border = '+' + '-' * viewWidth + '+'
+        screen.putText(0, 0, border, borderColor)
+        screen.putText(0, viewHeight + 1, border, borderColor)
+        for y in range(1, viewHeight + 1):
+            screen.putChar(0, y, '|', borderColor)
+            screen.putChar(viewWidth + 1, y, '|', borderColor)
+        for x, y, symbol, color in self.game.getTreasuresInView(session, viewX, viewY, viewWidth, viewHeight):
+            screen.putChar(x - viewX + 1, y - viewY + 1, symbol, color)
+        screen.putChar(board.x_coord - viewX + 1, board.y_coord - viewY + 1, '@', playerColor)
+        screen.putText(0, viewHeight + 2, '(%d, %d)  arrow keys or w/a/s/d to move' % (board.x_coord, board.y_coord))
+
+
+    # Draws the treasure's text in a box in the middle of the board.
+    def drawMessage(self):
+        x_coord, y_coord = self.session.board.collidingWith
+        width = max(10, min(60, self.screen.width - 4))
+        lines = []
+        for line in self.game.getTreasureText(self.session, x_coord, y_coord):
+            lines.extend(textwrap.wrap(line, width - 4) or [''])
+        lines.append('')
+        lines.append('Any key to continue.')
+        boxWidth = max(len(line) for line in lines) + 4
+        box = ['+' + '-' * (boxWidth - 2) + '+'] + ['| ' + line.ljust(boxWidth - 4) + ' |' for line in lines]
+        box.append(box[0])
+        self.screen.putCenteredLines(box)
+
+
+    def draw(self):
+        self.screen.clear()
+        mode = self.session.mode
+        if mode in ('play', 'message'):
+            self.drawBoard()
+            if mode == 'message':
+                self.drawMessage()
+        else:
+            self.screen.putCenteredLines(self.game.screens[mode])
+        sys.stdout.write(self.screen.getUpdate())
+        sys.stdout.flush()
+
+
+    # Turns what the terminal sent into key names. Arrow keys become w, a, s and d,
+    # and Enter, space and anything else that isn't a letter become None, for 'any other key'.
+    def getKeys(self, data):
+        keys = []
+        i = 0
+        while i < len(data):
+            if data[i] == '\x1b' and data[i + 1:i + 2] in ('[', 'O') and i + 2 < len(data):
+                keys.append(arrowKeys.get(data[i + 2]))
+                i += 3
+            else:
+                keys.append(data[i].lower() if data[i].isalnum() else None)
+                i += 1
+        return keys
+
+
+    # Plays until the player quits from the win screen.
+    # select() carries on waiting after a signal is handled, so a resize wouldn't be drawn until the next key press.
+    # To wake it up, every signal writes a byte to a pipe with signal.set_wakeup_fd(), and select() watches the pipe too.
+    def run(self):
+        inputFile = sys.stdin.fileno()
+        savedTerminal = termios.tcgetattr(inputFile)
+        wakeupRead, wakeupWrite = os.pipe()
+        os.set_blocking(wakeupRead, False)
+        os.set_blocking(wakeupWrite, False)
+        savedWakeup = signal.set_wakeup_fd(wakeupWrite)
+        signal.signal(signal.SIGWINCH, self.onResize)
+        sys.stdout.write(enterScreen)
+        try:
+            tty.setcbreak(inputFile)
+            self.draw()
+            while self.running:
+                ready = select.select([inputFile, wakeupRead], [], [])[0]
+                if wakeupRead in ready:
+                    os.read(wakeupRead, 1024)
+                if self.resized:
+                    self.resized = False
+                    columns, rows = shutil.get_terminal_size()
+                    self.screen.resize(columns, rows)
+                if inputFile in ready:
+                    # Everything that has arrived is handled before drawing, so held down keys
+                    # and slow connections don't leave the screen lagging behind.
+                    for key in self.getKeys(os.read(inputFile, 1024).decode('utf-8', 'replace')):
+                        if not self.game.pressKey(self.session, key):
+                            self.running = False
+                            break
+                if self.running:
+                    self.draw()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            termios.tcsetattr(inputFile, termios.TCSADRAIN, savedTerminal)
+            signal.set_wakeup_fd(savedWakeup)
+            os.close(wakeupRead)
+            os.close(wakeupWrite)
+            sys.stdout.write(leaveScreen)
+            sys.stdout.flush()
+            self.game.close()
+
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Play Cyborg Locates Feline in a terminal.")
+    parser.add_argument('--width', type=int, default=40, help="grid width")
+    parser.add_argument('--height', type=int, default=40, help="grid height")
+    parser.add_argument('--treasures', type=int, default=20, help="how many things are in the world")
+    parser.add_argument('--seed', type=int, default=None, help="seed for the random numbers")
+    args = parser.parse_args()
+    if args.treasures < minTreasures:
+        parser.error("--treasures has to be at least %d, counting feline" % minTreasures)
+    if not sys.stdin.isatty():
+        print("clfterm.py needs to be run in a terminal.", file=sys.stderr)
+        sys.exit(1)
+    # treasures.txt is looked for next to this file.
+    os.chdir(os.path.dirname(os.path.abspath(__file__)))
+    TerminalGame(args.width, args.height, args.treasures, args.seed).run()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,120 @@
+#! /usr/bin/python3
+
+# Programmer: Eric Shumaker
+# File: clftext.py
+# Language Version: Python 3.5.1
+# Depends On:   clfcore.py,
+#               treasures.txt
+#
+# The text version of Cyborg Locates Feline, that clfserver.py and clfterm.py both play. There's no window
+# and no pygame. Each game is a clfcore Board, and the treasures are drawn as characters with ANSI colors.
+# The server and the terminal only differ in how key presses get to the game and how the screen gets back.
+#
+# It isn't clf.py with its drawing swapped out. GameSettings in clf.py is built around pygame all the way
+# through, from the fonts and surfaces to the event loop and the dirty rectangles, and so are the autopilot,
+# fog, wandering, saving and replays that hang off it. So the text version plays the simpler game the
+# clfcore Board has, and none of those are in it.
+
+import random
+from clfcore import TreasureCorpus, Board, getASCIIScreens, getModeAfterKey, treasureSymbols, UP, DOWN, LEFT, RIGHT, BUMPED, FOUND
+
+
+# ANSI codes for the colors treasures can be. The player is always bold white.
+# Each one starts by resetting, so it doesn't matter what color came before it.
+treasureColors = ['\x1b[0;31m', '\x1b[0;32m', '\x1b[0;33m', '\x1b[0;34m', '\x1b[0;35m', '\x1b[0;36m',
+                  '\x1b[0;91m', '\x1b[0;92m', '\x1b[0;93m', '\x1b[0;94m', '\x1b[0;95m', '\x1b[0;96m']
+playerColor = '\x1b[0;1;97m'
+plainColor = '\x1b[0m'
+moveKeys = {'w': UP, 's': DOWN, 'a': LEFT, 'd': RIGHT}
+
+
+
+class TextSession():
+    """One player's game. Only what is different for each player is kept here: the Board, the mode the
+    game is in, and a number that decides what every treasure on the current board looks like and says.
+    Everything else, like the treasure text, belongs to the TextGame and is shared by every session."""
+    __slots__ = ('board', 'mode', 'boardSeed')
+
+    def __init__(self, board, boardSeed):
+        self.board = board
+        self.mode = 'splash'
+        self.boardSeed = boardSeed
+
+
+
+class TextGame():
+    """The rules and modes for any number of sessions, the same as the pygame game's.
+    The treasure text is read once, with a TreasureCorpus, and shared by every session.
+    What each treasure looks like and says is worked out from its location and the session's
+    boardSeed whenever it's needed, instead of being stored. moveInstructions are the lines
+    for the instructions screen that say how to move, since that's different for each frontend."""
+    def __init__(self, gridWidth=40, gridHeight=40, numOfTreasures=20, seed=None, treasureFilename='treasures.txt',
+                 moveInstructions=None):
+        self.gridWidth = gridWidth
+        self.gridHeight = gridHeight
+        self.numOfTreasures = numOfTreasures
+        self.rng = random.Random(seed)
+        self.treasureTexts = TreasureCorpus(treasureFilename)
+        self.screens = getASCIIScreens(moveInstructions)
+
+
+    def newSession(self):
+        board = Board(self.gridWidth, self.gridHeight, self.numOfTreasures, self.rng)
+        return TextSession(board, self.rng.getrandbits(32))
+
+
+    # Does whatever pressing the key does in the session's mode, the same as the pygame game.
+    # Returns False if the key quits.
+    def pressKey(self, session, key):
+        board = session.board
+        if session.mode == 'play':
+            action = moveKeys.get(key)
+            if action is not None:
+                result = board.step(action)
+                if result == BUMPED:
+                    session.mode = 'message'
+                elif result == FOUND:
+                    session.mode = 'win'
+            return True
+        newMode = getModeAfterKey(session.mode, key)
+        if newMode == 'quit':
+            return False
+        if newMode == 'newgame':
+            board.reset()
+            session.boardSeed = self.rng.getrandbits(32)
+            newMode = 'play'
+        # The Board keeps track of whether a message is showing too, so it has to be told it's gone.
+        board.mode = 'win' if newMode in ('win', 'credits') else 'play'
+        session.mode = newMode
+        return True
+
+
+    # Picks a number for a treasure that stays the same for as long as it's on the board.
+    def getTreasureNumber(self, session, x_coord, y_coord):
+        return (x_coord * 7919 + y_coord * 104729 + session.boardSeed) & 0x7fffffff
+
+
+    # Returns the symbol a treasure is drawn as, and the ANSI code for its color.
+    def getTreasureLook(self, session, x_coord, y_coord):
+        number = self.getTreasureNumber(session, x_coord, y_coord)
+        return treasureSymbols[number % len(treasureSymbols)], treasureColors[number % len(treasureColors)]
+
+
+    # Returns the treasures in the part of the board width by height cells from (viewX, viewY),
+    # as a list of (x, y, symbol, color) for drawing.
+    def getTreasuresInView(self, session, viewX, viewY, width, height):
+        items = session.board.items
+        # Looking up every cell in view is only worth it when there are more treasures than cells.
+        if len(items) > width * height:
+            locations = [(x, y) for y in range(viewY, viewY + height) for x in range(viewX, viewX + width) if (x, y) in items]
+        else:
+            locations = [(x, y) for x, y in items if viewX <= x < viewX + width and viewY <= y < viewY + height]
+        return [(x, y) + self.getTreasureLook(session, x, y) for x, y in locations]
+
+
+    def getTreasureText(self, session, x_coord, y_coord):
+        return self.treasureTexts.getEntry(self.getTreasureNumber(session, x_coord, y_coord) % len(self.treasureTexts))
+
+
+    def close(self):
+        self.treasureTexts.close()